@@ -0,0 +1,60 @@
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from handlers.pinterest import find_video_url  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pinterest"
+PADDING = (
+    '{"id":"900000000000","type":"pin","title":"filler",'
+    '"images":{"236x":{"url":"https://i.pinimg.com/236x/aa/bb/cc/filler.jpg",'
+    '"width":236,"height":354}},"description":"' + "x" * 400 + '"},'
+)
+
+LEGACY_PATTERNS = [
+    r'"videos":\s*{.*?"url"\s*:\s*"(https?://[^"]+\.mp4[^"]*)"',
+    r'<meta property="og:video" content="(https?://[^"]+\.mp4[^"]*)"',
+    r'<video[^>]+src="(https?://[^"]+\.mp4[^"]*)"',
+    r'<source[^>]+src="(https?://[^"]+\.mp4[^"]*)"',
+    r'(https?://[^"]+\.mp4[^"]*)',
+]
+
+
+def legacy_find_video_url(html: str) -> str | None:
+    for pattern in LEGACY_PATTERNS:
+        match = re.search(pattern, html, re.DOTALL)
+        if match:
+            return match.group(1).replace("\\/", "/")
+    return None
+
+
+def padded(html: str, copies: int) -> str:
+    return html.replace("</script>", PADDING * copies + "</script>", 1)
+
+
+def measure(func, html: str, number: int) -> float:
+    return min(timeit.repeat(lambda: func(html), number=number, repeat=5)) / number
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'fixture':<22}{'size':>10}{'legacy ms':>12}{'new ms':>10}  result")
+    for path in sorted(FIXTURES.glob("*.html")):
+        for name, html in (
+            (path.stem, path.read_text()),
+            (f"{path.stem}+pad", padded(path.read_text(), copies)),
+        ):
+            number = 20 if len(html) > 500_000 else 200
+            legacy = measure(legacy_find_video_url, html, number) * 1000
+            new = measure(find_video_url, html, number) * 1000
+            print(f"{name:<22}{len(html):>10}{legacy:>12.3f}{new:>10.3f}")
+            print(f"{'':<54}legacy: {legacy_find_video_url(html)}")
+            print(f"{'':<54}new:    {find_video_url(html)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+import dotenv
+
+dotenv.load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(
+    (BOT_TOKEN or "").encode()
+).hexdigest()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+LOCAL_BOT_API = bool(TELEGRAM_API_URL)
+UPLOAD_LIMIT = (2000 if LOCAL_BOT_API else 50) * 1024 * 1024
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+RELAY_CHUNK_SIZE = int(os.getenv("RELAY_CHUNK_SIZE", str(256 * 1024)))
+RELAY_SPILL_SIZE = int(os.getenv("RELAY_SPILL_SIZE", str(20 * 1024 * 1024)))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+DOWNLOAD_ROOT = os.getenv("DOWNLOAD_ROOT", "downloads")
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "300"))
+JANITOR_TTL = int(os.getenv("JANITOR_TTL", "3600"))
+JANITOR_QUOTA = int(os.getenv("JANITOR_QUOTA", str(10 * 1024 * 1024 * 1024)))
+
+FILE_CACHE_PATH = os.getenv("FILE_CACHE_PATH", "downloads/file_cache.sqlite3")
+FILE_CACHE_TTL = int(os.getenv("FILE_CACHE_TTL", str(30 * 24 * 3600)))
+FILE_CACHE_MAX_ENTRIES = int(os.getenv("FILE_CACHE_MAX_ENTRIES", "50000"))
+
+DOWNLOAD_WORKERS = {
+    "youtube": int(os.getenv("DOWNLOAD_WORKERS_YOUTUBE", "3")),
+    "youtube_probe": int(os.getenv("DOWNLOAD_WORKERS_YOUTUBE_PROBE", "2")),
+    "soundcloud": int(os.getenv("DOWNLOAD_WORKERS_SOUNDCLOUD", "3")),
+    "soundcloud_album": int(os.getenv("DOWNLOAD_WORKERS_SOUNDCLOUD_ALBUM", "4")),
+    "instagram": int(os.getenv("DOWNLOAD_WORKERS_INSTAGRAM", "3")),
+    "pinterest": int(os.getenv("DOWNLOAD_WORKERS_PINTEREST", "4")),
+    "tiktok": int(os.getenv("DOWNLOAD_WORKERS_TIKTOK", "4")),
+    "ffmpeg": int(os.getenv("FFMPEG_WORKERS", "2")),
+}
+USER_MAX_JOBS = int(os.getenv("USER_MAX_JOBS", "2"))
+USER_JOBS_PER_MINUTE = int(os.getenv("USER_JOBS_PER_MINUTE", "10"))
+USER_QUEUE_SIZE = int(os.getenv("USER_QUEUE_SIZE", "20"))
+
+RATE_LIMITS = {
+    "youtube": float(os.getenv("RATE_LIMIT_YOUTUBE", "5")),
+    "youtube_probe": float(os.getenv("RATE_LIMIT_YOUTUBE_PROBE", "5")),
+    "soundcloud": float(os.getenv("RATE_LIMIT_SOUNDCLOUD", "5")),
+    "soundcloud_album": float(os.getenv("RATE_LIMIT_SOUNDCLOUD_ALBUM", "5")),
+    "instagram": float(os.getenv("RATE_LIMIT_INSTAGRAM", "1")),
+    "pinterest": float(os.getenv("RATE_LIMIT_PINTEREST", "5")),
+    "tiktok": float(os.getenv("RATE_LIMIT_TIKTOK", "2")),
+}
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+THROTTLE_BASE_DELAY = float(os.getenv("THROTTLE_BASE_DELAY", "2"))
+THROTTLE_MAX_DELAY = float(os.getenv("THROTTLE_MAX_DELAY", "60"))
+THROTTLE_RETRIES = int(os.getenv("THROTTLE_RETRIES", "2"))
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "4"))
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "1"))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "50"))
+CANCEL_GRACE_PERIOD = float(os.getenv("CANCEL_GRACE_PERIOD", "10"))
+PROCESS_POOL_PLATFORMS = {
+    name.strip()
+    for name in os.getenv("PROCESS_POOL_PLATFORMS", "").split(",")
+    if name.strip()
+}
+
+YT_PROBE_TTL = int(os.getenv("YT_PROBE_TTL", "3600"))
+YT_PROBE_CACHE_SIZE = int(os.getenv("YT_PROBE_CACHE_SIZE", "256"))
+YT_HEIGHTS = tuple(
+    int(height) for height in os.getenv("YT_HEIGHTS", "360,480,720,1080").split(",")
+)
+
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.4"))
+INLINE_CACHE_TTL = int(os.getenv("INLINE_CACHE_TTL", "600"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+CACHE_CHAT_ID = os.getenv("CACHE_CHAT_ID", "")
+
+SC_ALBUM_PARALLELISM = int(os.getenv("SC_ALBUM_PARALLELISM", "3"))
+SC_ALBUM_TIMEOUT = int(os.getenv("SC_ALBUM_TIMEOUT", "1800"))
+ALBUM_VOLUME_SIZE = int(os.getenv("ALBUM_VOLUME_SIZE", str(UPLOAD_LIMIT)))
+
+CALLBACK_STORE = os.getenv("CALLBACK_STORE", "sqlite")
+CALLBACK_STORE_PATH = os.getenv("CALLBACK_STORE_PATH", "downloads/callback_state.sqlite3")
+CALLBACK_STORE_URL = os.getenv("CALLBACK_STORE_URL", "redis://localhost:6379/0")
+CALLBACK_STORE_TTL = int(os.getenv("CALLBACK_STORE_TTL", str(7 * 24 * 3600)))
+CALLBACK_STORE_MAX_SIZE = int(os.getenv("CALLBACK_STORE_MAX_SIZE", "100000"))
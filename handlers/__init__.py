@@ -1,4 +1,5 @@
 from .handler import router as handlers_router
+from .inline import router as inline_router
 from .instagram import router as instagram_router
 from .pinterest import router as pinterest_router
 from .soundcloud import router as soundcloud_router
@@ -12,4 +13,5 @@ __all__ = [
     "youtube_router",
     "tiktok_router",
     "soundcloud_router",
+    "inline_router",
 ]
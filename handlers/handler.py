@@ -1,7 +1,9 @@
 from aiogram import Bot, Router
-from aiogram.filters import CommandStart
+from aiogram.filters import Command, CommandStart
 from aiogram.types import BotCommand, Message
 
+from services.scheduler import scheduler
+
 router = Router()
 
 
@@ -14,11 +16,18 @@ async def start_bot(message: Message):
     )
 
 
+@router.message(Command("cancel"))
+async def cancel_downloads(message: Message):
+    cancelled = scheduler.cancel_user(message.from_user.id)
+    if cancelled:
+        await message.answer(f"🛑 Отменено загрузок: {cancelled}")
+    else:
+        await message.answer("Нет активных загрузок.")
+
+
 async def set_commands(bot: Bot):
     commands = [
         BotCommand(command="start", description="Запустить бота 🚀"),
+        BotCommand(command="cancel", description="Отменить мои загрузки 🛑"),
     ]
     await bot.set_my_commands(commands)
-
-
-
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import uuid
+
+from aiogram import Bot, Router
+from aiogram.types import (InlineQuery, InlineQueryResultArticle,
+                           InlineQueryResultCachedAudio,
+                           InlineQueryResultCachedDocument,
+                           InlineQueryResultCachedPhoto,
+                           InlineQueryResultCachedVideo,
+                           InputTextMessageContent)
+
+import config
+from handlers.instagram import upload_instagram
+from handlers.soundcloud import upload_sc_track
+from handlers.tiktok import upload_tiktok
+from handlers.youtube import upload_youtube
+from services.file_cache import CachedFile, file_cache
+from services.links import MediaLink, parse, resolve
+from services.quotas import quota_middleware
+from services.scheduler import Job
+from services.singleflight import deliver
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+CAPTION = "Скачано в @SaveTTasrobot"
+INLINE_KINDS = {
+    "youtube": {"video", "shorts"},
+    "tiktok": {"video", "short"},
+    "instagram": {"post", "reel", "tv"},
+    "soundcloud": {"track", "album", "short"},
+}
+
+latest_queries: dict[int, str] = {}
+prefetches: set[asyncio.Task] = set()
+
+
+class CacheChat:
+    def __init__(self, bot: Bot, chat_id: int | str):
+        self.bot = bot
+        self.chat_id = chat_id
+
+    async def answer_video(self, video, **kwargs):
+        return await self.bot.send_video(self.chat_id, video, **kwargs)
+
+    async def answer_audio(self, audio, **kwargs):
+        return await self.bot.send_audio(self.chat_id, audio, **kwargs)
+
+    async def answer_photo(self, photo, **kwargs):
+        return await self.bot.send_photo(self.chat_id, photo, **kwargs)
+
+    async def answer_document(self, document, **kwargs):
+        return await self.bot.send_document(self.chat_id, document, **kwargs)
+
+    async def answer_animation(self, animation, **kwargs):
+        return await self.bot.send_animation(self.chat_id, animation, **kwargs)
+
+    async def answer_media_group(self, media, **kwargs):
+        return await self.bot.send_media_group(self.chat_id, media, **kwargs)
+
+
+async def debounce(query: InlineQuery) -> bool:
+    user_id = query.from_user.id
+    latest_queries[user_id] = query.id
+    await asyncio.sleep(config.INLINE_DEBOUNCE)
+    return latest_queries.get(user_id) == query.id
+
+
+def superseded(query: InlineQuery) -> bool:
+    user_id = query.from_user.id
+    if latest_queries.get(user_id) != query.id:
+        return True
+    del latest_queries[user_id]
+    return False
+
+
+def forget_query(query: InlineQuery):
+    if latest_queries.get(query.from_user.id) == query.id:
+        del latest_queries[query.from_user.id]
+
+
+def inline_formats(link: MediaLink) -> list[str]:
+    if link.platform == "youtube":
+        return [f"{height}p" for height in config.YT_HEIGHTS] + ["mp3"]
+    if link.platform == "soundcloud":
+        return ["album"] if link.kind == "album" else ["mp3"]
+    return {"tiktok": ["mp4"], "instagram": ["media"]}[link.platform]
+
+
+def prefetch_upload(link: MediaLink):
+    if link.platform == "youtube":
+        heights = [height for height in config.YT_HEIGHTS if height <= 720]
+        fmt = f"{max(heights or config.YT_HEIGHTS)}p"
+        key = link.key(fmt)
+        return key, upload_youtube, (link.url, fmt, key)
+
+    key = link.key(inline_formats(link)[0])
+    if link.platform == "tiktok":
+        return key, upload_tiktok, (link.url, key)
+    if link.platform == "instagram":
+        return key, upload_instagram, (link.url, key)
+    if link.platform == "soundcloud" and link.kind == "track":
+        return key, upload_sc_track, (link.url, key)
+    return None
+
+
+def cached_result(result_id: str, item: CachedFile, title: str):
+    if item.kind == "video":
+        return InlineQueryResultCachedVideo(
+            id=result_id, video_file_id=item.file_id, title=title, caption=CAPTION
+        )
+    if item.kind == "audio":
+        return InlineQueryResultCachedAudio(
+            id=result_id, audio_file_id=item.file_id, caption=CAPTION
+        )
+    if item.kind == "photo":
+        return InlineQueryResultCachedPhoto(
+            id=result_id, photo_file_id=item.file_id, caption=CAPTION
+        )
+    return InlineQueryResultCachedDocument(
+        id=result_id, document_file_id=item.file_id, title=title, caption=CAPTION
+    )
+
+
+async def cached_results(link: MediaLink) -> list:
+    results = []
+    for fmt in inline_formats(link):
+        for index, item in enumerate(await file_cache.get(link.key(fmt))):
+            result_id = f"{len(results)}_{fmt}_{index}_{link.media_id}"[:64]
+            title = "MP3" if fmt == "mp3" else fmt
+            results.append(cached_result(result_id, item, title))
+    return results[:50]
+
+
+def start_prefetch(bot: Bot, link: MediaLink, user_id: int):
+    upload = prefetch_upload(link)
+    if not config.CACHE_CHAT_ID or upload is None:
+        return
+
+    key, func, args = upload
+
+    async def prefetch():
+        with quota_middleware.try_acquire(user_id) as allowed:
+            if not allowed:
+                logger.info("Prefetch %s skipped: user %s over quota", key, user_id)
+                return
+            try:
+                chat = CacheChat(bot, config.CACHE_CHAT_ID)
+                await deliver(key, CAPTION, func, chat, *args, Job(user_id))
+            except Exception as e:
+                logger.warning("Prefetch %s failed: %s", key, e)
+
+    task = asyncio.create_task(prefetch())
+    prefetches.add(task)
+    task.add_done_callback(prefetches.discard)
+
+
+@router.inline_query()
+async def inline_dispatcher(
+    query: InlineQuery, bot: Bot, link: MediaLink | None = None
+):
+    link = link or parse(query.query)
+    if link is None or link.kind not in INLINE_KINDS.get(link.platform, ()):
+        return
+
+    if not await debounce(query):
+        return
+    link = await resolve(link)
+    if link.kind not in INLINE_KINDS[link.platform]:
+        forget_query(query)
+        return
+    results = await cached_results(link)
+    if superseded(query):
+        return
+
+    if results:
+        await query.answer(
+            results, cache_time=config.INLINE_CACHE_TIME, is_personal=False
+        )
+        return
+
+    start_prefetch(bot, link, query.from_user.id)
+    await query.answer(
+        [
+            InlineQueryResultArticle(
+                id=str(uuid.uuid4()),
+                title="📥 Отправить ссылку в чат для скачивания",
+                description="Файл ещё не в кэше — бот скачает его по ссылке",
+                input_message_content=InputTextMessageContent(message_text=link.url),
+            )
+        ],
+        cache_time=5,
+        is_personal=False,
+    )
@@ -1,68 +1,131 @@
 import asyncio
 import os
-import logging
+
 import yt_dlp
-from aiogram import F, Router
-from aiogram.types import FSInputFile, Message
+from aiogram import Router
+from aiogram.types import Message
+
+import config
+
+from services.cancellation import CancelToken, with_cancel_hooks
+from services.file_cache import file_cache, send_cached
+from services.janitor import janitor
+from services.links import IsLink, MediaLink, parse
+from services.metrics import count_bytes, timed
+from services.scheduler import Job, scheduler
+from services.singleflight import deliver
+from services.throttle import throttles
+from services.uploads import ensure_uploadable, input_file, send_media
 
 router = Router()
 
 DOWNLOAD_DIR = "downloads/instagram_downloads"
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-INSTAGRAM_REGEX = r"(https?://)?(www\.)?(instagram\.com|instagr\.am)/(p|reel|reels|tv)/[A-Za-z0-9_-]+"
+YDL_OPTIONS = {
+    "format": "mp4",
+    "quiet": True,
+    "http_headers": {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/91.0.4472.124 Safari/537.36"
+    },
+    "noplaylist": True,
+    "max_filesize": config.UPLOAD_LIMIT,
+}
+
+
+def extract_instagram(url: str, token: CancelToken | None = None) -> dict:
+    with yt_dlp.YoutubeDL(with_cancel_hooks(YDL_OPTIONS, token)) as ydl:
+        info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info)
 
 
-def download_instagram(url: str, output_path: str) -> list[str]:
+def download_instagram_entry(
+    entry: dict, output_path: str, token: CancelToken | None = None
+) -> str:
     ydl_opts = {
-        "format": "mp4",
+        **YDL_OPTIONS,
         "outtmpl": os.path.join(output_path, "%(id)s.%(ext)s"),
-        "quiet": True,
-        "headers": {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/91.0.4472.124 Safari/537.36"
-        },
-        "sleep_interval": 3,
-        "max_sleep_interval": 5,
-        "noplaylist": True,
     }
-    filepaths = []
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
+    with yt_dlp.YoutubeDL(with_cancel_hooks(ydl_opts, token)) as ydl:
+        entry = ydl.process_ie_result(entry, download=True)
+        return ydl.prepare_filename(entry)
+
+
+async def fetch_instagram(url: str, output_path: str, job: Job) -> list[str]:
+    throttle = throttles["instagram"]
+    async with timed("extract", "instagram"):
+        info = await throttle.call(
+            scheduler.run, "instagram", job, extract_instagram, url, job.token
+        )
+    entries = [entry for entry in info.get("entries") or [info] if entry]
+
+    async def fetch_entry(entry: dict) -> str:
+        entry_job = job if len(entries) == 1 else Job(job.user_id)
+        return await throttle.call(
+            scheduler.run,
+            "instagram",
+            entry_job,
+            download_instagram_entry,
+            entry,
+            output_path,
+            entry_job.token,
+        )
+
+    tasks = [asyncio.create_task(fetch_entry(entry)) for entry in entries]
+    try:
+        async with timed("download", "instagram"):
+            return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def media_kind(filepath: str) -> str | None:
+    if filepath.endswith(".mp4"):
+        return "video"
+    if filepath.endswith((".jpg", ".jpeg", ".png")):
+        return "photo"
+    return None
 
-        if "entries" in info:
-            for entry in info["entries"]:
-                filepaths.append(ydl.prepare_filename(entry))
-        else:
-            filepaths.append(ydl.prepare_filename(info))
 
-    return filepaths
+async def upload_instagram(message: Message, url: str, key: str, job: Job):
+    with janitor.workdir(DOWNLOAD_DIR, job) as workdir:
+        filepaths = await fetch_instagram(url, str(workdir), job)
+        items = []
+        for filepath in filepaths:
+            kind = media_kind(filepath)
+            if kind:
+                items.append((kind, input_file(ensure_uploadable(filepath))))
+                count_bytes("instagram", filepath)
+        async with timed("upload", "instagram"):
+            sent_messages = await send_media(
+                message, items, "Скачано в @SaveTTasrobot"
+            )
+
+    return await file_cache.remember(key, *sent_messages)
+
 
+@router.message(IsLink("instagram", "post", "reel", "tv"), flags={"download": True})
+async def handle_instagram(message: Message, link: MediaLink | None = None):
+    link = link or parse(message.text)
+    url = link.url
+    key = link.key("media")
+    cached = await file_cache.get(key)
+    if cached:
+        await send_cached(message, cached, "Скачано в @SaveTTasrobot")
+        return
 
-@router.message(F.text.regexp(INSTAGRAM_REGEX))
-async def handle_instagram(message: Message):
-    url = message.text.strip()
     status_message = await message.answer("Скачиваю Instagram...")
 
+    job = Job(message.from_user.id, status_message)
     try:
-        loop = asyncio.get_event_loop()
-        filepaths = await loop.run_in_executor(
-            None, download_instagram, url, DOWNLOAD_DIR
+        await deliver(
+            key, "Скачано в @SaveTTasrobot", upload_instagram, message, url, key, job
         )
 
-        for filepath in filepaths:
-            if filepath.endswith(".mp4"):
-                await message.answer_video(
-                    FSInputFile(filepath), caption="Скачано в @SaveTTasrobot"
-                )
-            elif filepath.endswith((".jpg", ".jpeg", ".png")):
-                await message.answer_photo(
-                    FSInputFile(filepath), caption="Скачано в @SaveTTasrobot"
-                )
-
-            os.remove(filepath)
-
     except Exception as e:
         await message.answer(f"Ошибка при загрузке: {e}")
     finally:
@@ -1,99 +1,218 @@
-import asyncio
+import codecs
+import json
+import logging
 import re
 import uuid
 from pathlib import Path
 
-import requests
 import yt_dlp
-from aiogram import F, Router, types
-from aiogram.types import (FSInputFile, InlineQuery, InlineQueryResultArticle,
+from aiogram import Router, types
+from aiogram.types import (InlineQuery, InlineQueryResultArticle,
                            InputTextMessageContent, Message)
+from aiohttp import StreamReader
+
+import config
+from handlers.inline import debounce, superseded
+from services.cancellation import CancelToken
+from services.http_client import http_client
+from services.janitor import janitor
+from services.links import IsLink, MediaLink, parse, resolve
+from services.metrics import count_bytes, timed
+from services.scheduler import Job, scheduler
+from services.singleflight import flights
+from services.state_store import CallbackStore
+from services.state_store import backend as state_backend
+from services.uploads import (FileTooLargeError, StreamInputFile,
+                              ensure_uploadable, input_file, size_label)
 
 router = Router()
+logger = logging.getLogger(__name__)
 
+VIDEO_LIST_MARKER = '"video_list":'
+WHITESPACE_REGEX = re.compile(r"\s*")
+MP4_URL_REGEX = re.compile(r'https?:(?://|\\/\\/)[^"\'\s<>]+?\.mp4[^"\'\s<>\\]*')
+QUALITY_REGEX = re.compile(r"(\d{3,4})[pP]")
+JSON_DECODER = json.JSONDecoder()
 
-async def extract_video_url(page_url: str) -> str:
+DOWNLOAD_DIR = "downloads/pinterest_videos"
+
+inline_urls = CallbackStore(state_backend, "pin_inline", config.INLINE_CACHE_TTL)
+
+
+async def save_stream(
+    stream: StreamReader, filepath: Path, token: CancelToken | None = None
+):
+    with open(filepath, "wb") as f:
+        async for chunk in stream.iter_chunked(config.RELAY_CHUNK_SIZE):
+            if token:
+                token.check()
+            f.write(chunk)
+
+
+async def relay_video(message: Message, video_url: str, job: Job):
+    token = job.token
+    async with http_client.session.get(video_url) as video_response:
+        if video_response.status != 200:
+            raise Exception(
+                f"Ошибка скачивания видео: {video_response.status}"
+            )
+
+        size = video_response.content_length
+        if size is not None and size > config.UPLOAD_LIMIT:
+            raise FileTooLargeError(
+                f"Файл {size_label(size)} больше лимита Telegram "
+                f"({size_label(config.UPLOAD_LIMIT)})"
+            )
+
+        if size is not None and size <= config.RELAY_SPILL_SIZE:
+            video = StreamInputFile(
+                video_response.content, f"pinterest_{token.marker}.mp4", token=token
+            )
+            sent = await message.answer_video(
+                video=video, caption="Скачано в @SaveTTasrobot"
+            )
+            count_bytes("pinterest", size)
+            return sent
+
+        with janitor.workdir(DOWNLOAD_DIR, job) as workdir:
+            filepath = workdir / f"pinterest_{token.marker}.mp4"
+            await save_stream(video_response.content, filepath, token)
+            sent = await message.answer_video(
+                video=input_file(ensure_uploadable(filepath)),
+                caption="Скачано в @SaveTTasrobot",
+            )
+            count_bytes("pinterest", filepath)
+            return sent
+
+
+def variant_score(key: str, variant: dict) -> int:
+    width, height = variant.get("width"), variant.get("height")
+    if isinstance(width, int) and isinstance(height, int):
+        return width * height
+    return url_score(key) ** 2
+
+
+def url_score(url: str) -> int:
+    match = QUALITY_REGEX.search(url)
+    return int(match.group(1)) if match else 0
+
+
+def best_variant(video_list) -> str | None:
+    if not isinstance(video_list, dict):
+        return None
+    variants = [
+        (variant_score(key, variant), variant["url"])
+        for key, variant in video_list.items()
+        if isinstance(variant, dict)
+        and isinstance(variant.get("url"), str)
+        and ".mp4" in variant["url"]
+    ]
+    return max(variants)[1] if variants else None
+
+
+class PageScanner:
+    def __init__(self):
+        self.html = ""
+        self._position = 0
+
+    def feed(self, text: str) -> str | None:
+        self.html += text
+        return self._scan_video_lists(final=False)
+
+    def finish(self) -> str | None:
+        return self._scan_video_lists(final=True) or self._scan_urls()
+
+    def _scan_video_lists(self, final: bool) -> str | None:
+        while True:
+            start = self.html.find(VIDEO_LIST_MARKER, self._position)
+            if start == -1:
+                self._position = max(
+                    self._position, len(self.html) - len(VIDEO_LIST_MARKER)
+                )
+                return None
+
+            value_start = WHITESPACE_REGEX.match(
+                self.html, start + len(VIDEO_LIST_MARKER)
+            ).end()
+            try:
+                video_list, _ = JSON_DECODER.raw_decode(self.html, value_start)
+            except ValueError:
+                if not final:
+                    return None
+                video_list = None
+
+            self._position = start + 1
+            video_url = best_variant(video_list)
+            if video_url:
+                return video_url
+
+    def _scan_urls(self) -> str | None:
+        candidates = [
+            match.group(0).replace("\\/", "/")
+            for match in MP4_URL_REGEX.finditer(self.html)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=url_score)
+
+
+def find_video_url(html: str) -> str | None:
+    scanner = PageScanner()
+    return scanner.feed(html) or scanner.finish()
+
+
+def probe_pinterest(page_url: str) -> dict:
+    with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
+        return ydl.sanitize_info(ydl.extract_info(page_url, download=False))
+
+
+async def extract_video_url(page_url: str, job: Job | None = None) -> str:
     try:
-        loop = asyncio.get_event_loop()
-        info = await loop.run_in_executor(
-            None,
-            lambda: yt_dlp.YoutubeDL({"quiet": True}).extract_info(
-                page_url, download=False
-            ),
-        )
+        info = await scheduler.run("pinterest", job, probe_pinterest, page_url)
 
         if "url" in info:
             return info["url"]
         elif "entries" in info and info["entries"]:
             return info["entries"][0].get("url")
     except Exception as e:
-        print(f"[yt-dlp fail] {e}")
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/91.0.4472.124 Safari/537.36",
-    }
-
-    response = await asyncio.to_thread(
-        lambda: requests.get(page_url, headers=headers, timeout=15)
-    )
+        logger.info("yt-dlp не справился с %s: %s", page_url, e)
 
-    if response.status_code != 200:
-        raise Exception(f"Ошибка доступа к странице: {response.status_code}")
+    async with http_client.session.get(page_url) as response:
+        if response.status != 200:
+            raise Exception(f"Ошибка доступа к странице: {response.status}")
 
-    html_content = response.text
+        scanner = PageScanner()
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")("replace")
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            video_url = scanner.feed(decoder.decode(chunk))
+            if video_url:
+                return video_url
+        scanner.feed(decoder.decode(b"", final=True))
 
-    patterns = [
-        r'"videos":\s*{.*?"url"\s*:\s*"(https?://[^"]+\.mp4[^"]*)"',
-        r'<meta property="og:video" content="(https?://[^"]+\.mp4[^"]*)"',
-        r'<video[^>]+src="(https?://[^"]+\.mp4[^"]*)"',
-        r'<source[^>]+src="(https?://[^"]+\.mp4[^"]*)"',
-        r'(https?://[^"]+\.mp4[^"]*)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, html_content, re.DOTALL)
-        if match:
-            return match.group(1).replace("\\/", "/")
+    video_url = scanner.finish()
+    if video_url:
+        return video_url
 
     raise Exception("Видео URL не найден в коде страницы")
 
 
 async def send_pinterest_video(message: Message, page_url: str):
+    job = Job(message.from_user.id)
     try:
-        video_url = await extract_video_url(page_url)
+        async with timed("extract", "pinterest"):
+            video_url = await extract_video_url(page_url, job)
 
         try:
-
-            await message.answer_video(
-                video=video_url, caption="Cкачано в @SaveTTasrobot"
-            )
+            async with timed("upload", "pinterest"):
+                await message.answer_video(
+                    video=video_url, caption="Cкачано в @SaveTTasrobot"
+                )
             return
         except Exception as e:
-            print(f"Прямая загрузка не сработала: {e}, качаю файл...")
+            logger.info("Прямая загрузка не сработала: %s, качаю файл...", e)
 
-        temp_dir = Path("downloads/pinterest_videos")
-        temp_dir.mkdir(exist_ok=True)
-        filepath = temp_dir / f"pinterest_{uuid.uuid4().hex}.mp4"
-
-        video_response = await asyncio.to_thread(
-            lambda: requests.get(video_url, stream=True, timeout=30)
-        )
-        if video_response.status_code != 200:
-            raise Exception(
-                f"Ошибка скачивания видео: {video_response.status_code}"
-            )
-
-        with open(filepath, "wb") as f:
-            for chunk in video_response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-
-        await message.answer_video(
-            video=FSInputFile(filepath), caption="Скачано в @SaveTTasrobot"
-        )
-        filepath.unlink()
+        async with timed("relay", "pinterest"):
+            await relay_video(message, video_url, job)
 
     except Exception as e:
         error_msg = str(e)
@@ -105,31 +224,62 @@ async def send_pinterest_video(message: Message, page_url: str):
                 "• Ссылка неверная"
             )
         await message.answer(error_msg)
-        print(f"Pinterest error: {e}")
+        logger.warning("Pinterest error: %s", e)
+
 
+def inline_video(link: MediaLink, video_url: str) -> types.InlineQueryResultVideo:
+    return types.InlineQueryResultVideo(
+        id=f"pin_{link.media_id}"[:64],
+        video_url=video_url,
+        mime_type="video/mp4",
+        thumbnail_url="https://upload.wikimedia.org/wikipedia/commons/0/08/Pinterest-logo.png",
+        title="🎬 Видео с Pinterest",
+        caption="Cкачано в @SaveTTasrobot",
+    )
 
-@router.inline_query()
-async def pinterest_inline(query: InlineQuery):
-    text = query.query.strip()
 
-    if not text or ("pinterest" not in text and "pin.it" not in text):
+@router.inline_query(IsLink("pinterest"))
+async def pinterest_inline(query: InlineQuery, link: MediaLink | None = None):
+    link = link or parse(query.query)
+
+    if link is None or link.platform != "pinterest":
+        return
+
+    video_url = await inline_urls.get(link.media_id)
+    if video_url:
+        await query.answer(
+            [inline_video(link, video_url)],
+            cache_time=config.INLINE_CACHE_TIME,
+            is_personal=False,
+        )
+        return
+
+    if not await debounce(query):
         return
 
     try:
-        video_url = await extract_video_url(text)
+        link = await resolve(link)
+        if link.kind != "pin":
+            raise Exception("Это не ссылка на Pinterest pin!")
+
+        video_url = await inline_urls.get(link.media_id)
+        if not video_url:
+            video_url, _ = await flights.run(
+                link.key("inline"), extract_video_url, link.url
+            )
+            await inline_urls.set(link.media_id, video_url)
 
-        result = types.InlineQueryResultVideo(
-            id=str(uuid.uuid4()),
-            video_url=video_url,
-            mime_type="video/mp4",
-            thumbnail_url="https://upload.wikimedia.org/wikipedia/commons/0/08/Pinterest-logo.png",
-            title="🎬 Видео с Pinterest",
-            caption="Cкачано в @SaveTTasrobot",
+        if superseded(query):
+            return
+        await query.answer(
+            [inline_video(link, video_url)],
+            cache_time=config.INLINE_CACHE_TIME,
+            is_personal=False,
         )
 
-        await query.answer([result], cache_time=0)
-
     except Exception as e:
+        if superseded(query):
+            return
         error_result = InlineQueryResultArticle(
             id=str(uuid.uuid4()),
             title="Ошибка",
@@ -140,41 +290,38 @@ async def pinterest_inline(query: InlineQuery):
         await query.answer([error_result], cache_time=0)
 
 
-@router.message(F.text.startswith("https://pin.it/"))
-async def handle_pinit_link(message: Message):
-    short_url = message.text.strip()
+@router.message(IsLink("pinterest", "short"), flags={"download": True})
+async def handle_pinit_link(message: Message, link: MediaLink | None = None):
+    link = link or parse(message.text)
     processing_msg = await message.answer("Распознаю короткую ссылку...")
 
     try:
-        response = await asyncio.to_thread(
-            lambda: requests.head(short_url, allow_redirects=True, timeout=10)
-        )
-        final_url = response.url
+        link = await resolve(link)
 
-        if "/pin/" not in final_url:
+        if link.kind != "pin":
             await processing_msg.edit_text("Это не ссылка на Pinterest pin!")
             return
 
         await processing_msg.edit_text("Скачиваю Pinterest видео...")
-        await send_pinterest_video(message, final_url)
+        await send_pinterest_video(message, link.url)
         await processing_msg.delete()
 
     except Exception as e:
         await processing_msg.edit_text(f"Ошибка при обработке ссылки: {e}")
 
 
-@router.message(F.text.regexp(r"^https?://(www\.|ru\.)?pinterest\.com/"))
-async def handle_pinterest_link(message: Message):
-    url = message.text.strip()
+@router.message(IsLink("pinterest", "pin", "page"), flags={"download": True})
+async def handle_pinterest_link(message: Message, link: MediaLink | None = None):
+    link = link or parse(message.text)
     processing_msg = await message.answer("Анализирую Pinterest ссылку...")
 
     try:
-        if "/pin/" not in url:
+        if link.kind != "pin":
             await processing_msg.edit_text("Это не ссылка на Pinterest pin!")
             return
 
         await processing_msg.edit_text("Скачиваю видео c Pinterest...")
-        await send_pinterest_video(message, url)
+        await send_pinterest_video(message, link.url)
         await processing_msg.delete()
 
     except Exception as e:
@@ -1,72 +1,82 @@
 import asyncio
-import uuid
-import zipfile
-import hashlib
+import logging
 from pathlib import Path
+from typing import NamedTuple
 
 import yt_dlp
 from aiogram import F, Router
-from aiogram.types import FSInputFile, Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 
+import config
+from services.cancellation import (CancelToken, JobCancelled, run_cancellable,
+                                   with_cancel_hooks)
+from services.archive import StreamingZip
+from services.file_cache import cache_key, file_cache, send_cached
+from services.janitor import janitor
+from services.links import IsLink, MediaLink, parse, resolve
+from services.metrics import count_bytes, timed
+from services.scheduler import Job, scheduler
+from services.singleflight import deliver
+from services.state_store import CallbackStore, callback_store
+from services.uploads import ensure_uploadable, input_file
+
 router = Router()
+logger = logging.getLogger(__name__)
 
 DOWNLOAD_DIR = Path("downloads/soundcloud_downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
-url_storage = {}
+url_storage = callback_store("sc")
+
+AUDIO_FORMAT = (
+    'bestaudio[acodec=mp3]/bestaudio[ext=mp3]/bestaudio[ext=m4a]'
+    '/bestaudio[acodec=opus]/bestaudio/best'
+)
+AUDIO_EXTENSIONS = ['mp3', 'm4a', 'opus', 'ogg', 'webm', 'aac', 'mp4']
+PASSTHROUGH_SUFFIXES = {'.mp3', '.m4a'}
+REMUX_SUFFIXES = {'.aac', '.mp4'}
 
 
 def get_url_hash(url: str) -> str:
-    return hashlib.md5(url.encode()).hexdigest()[:10]
+    return CallbackStore.make_key(url)
 
 
-def store_url(url: str) -> str:
-    url_hash = get_url_hash(url)
-    url_storage[url_hash] = url
-    return url_hash
+async def store_url(url: str) -> str:
+    return await url_storage.put(url)
 
 
-def get_url(hash: str) -> str:
-    return url_storage.get(hash, "")
+async def get_url(hash: str) -> str:
+    return await url_storage.get(hash) or ""
 
 
-async def download_sc_track(url: str) -> Path:
-    filepath = DOWNLOAD_DIR / f"soundcloud_{uuid.uuid4().hex}"
+async def download_sc_track(url: str, job: Job | None = None) -> Path:
+    job = job or Job()
+    filepath = DOWNLOAD_DIR / f"soundcloud_{job.token.marker}"
 
     ydl_opts = {
-        'format': 'bestaudio/best',
+        'format': AUDIO_FORMAT,
         'outtmpl': str(filepath) + '.%(ext)s',
         'quiet': False,
         'noplaylist': True,
-        'extractaudio': True,
-        'audioformat': 'mp3',
         'http_chunk_size': 10485760,
         'retries': 3,
         'fragment_retries': 3,
         'skip_unavailable_fragments': True,
         'extract_flat': False,
         'socket_timeout': 30,
+        'max_filesize': config.UPLOAD_LIMIT,
         'extractor_retries': 3,
         'noprogress': False,
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
     }
 
     try:
-        await run_yt_dlp_with_timeout(url, ydl_opts, timeout=300)
+        await run_yt_dlp_with_timeout(url, ydl_opts, timeout=300, job=job)
 
-        for ext in ['mp3', 'm4a', 'webm']:
+        for ext in AUDIO_EXTENSIONS:
             potential_file = filepath.with_suffix(f'.{ext}')
             if potential_file.exists():
-                return potential_file
-
-        audio_files = list(DOWNLOAD_DIR.glob(f"{filepath.stem}.*"))
-        if audio_files:
-            return audio_files[0]
+                return await telegram_audio(potential_file, job)
 
         raise FileNotFoundError("Скачанный файл не найден")
 
@@ -79,126 +89,195 @@ async def download_sc_track(url: str) -> Path:
         raise e
 
 
-async def download_sc_album(url: str) -> Path:
-    album_dir = DOWNLOAD_DIR / f"album_{uuid.uuid4().hex}"
-    album_dir.mkdir()
-
+def list_album_tracks(url: str) -> list[str]:
     ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': str(album_dir / '%(title)s.%(ext)s'),
-        'quiet': False,
-        'noplaylist': False,
-        'extractaudio': True,
-        'audioformat': 'mp3',
-        'http_chunk_size': 10485760,
-        'retries': 3,
-        'fragment_retries': 3,
-        'skip_unavailable_fragments': True,
+        'quiet': True,
+        'extract_flat': 'in_playlist',
         'socket_timeout': 30,
         'extractor_retries': 3,
-        'noprogress': False,
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
     }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
 
-    downloaded_files = []
+    return [
+        entry['url'] for entry in info.get('entries') or []
+        if entry and entry.get('url')
+    ]
 
-    try:
-        await run_yt_dlp_with_timeout(url, ydl_opts, timeout=1800)
 
-        audio_files = list(album_dir.glob("*.mp3"))
-        if not audio_files:
-            raise Exception("Не удалось скачать файлы альбома")
+def find_album_track(album_dir: Path, prefix: str) -> Path | None:
+    for ext in AUDIO_EXTENSIONS:
+        for file_path in album_dir.glob(f"{prefix}*.{ext}"):
+            return file_path
+    return None
 
-        downloaded_files = audio_files
 
-        zip_path = DOWNLOAD_DIR / f"{album_dir.name}.zip"
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in audio_files:
-                zipf.write(file_path, file_path.name)
+class AlbumResult(NamedTuple):
+    volumes: list[Path]
+    partial: bool
+    failed: int = 0
 
-        return zip_path
 
-    except asyncio.TimeoutError:
-        if downloaded_files:
-            zip_path = DOWNLOAD_DIR / f"{album_dir.name}_partial.zip"
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in downloaded_files:
-                    zipf.write(file_path, file_path.name)
-            return zip_path
-        else:
-            raise Exception("Таймаут при скачивании альбома")
-    finally:
-        for file_path in album_dir.glob("*"):
-            if file_path.is_file():
-                file_path.unlink()
-        try:
-            album_dir.rmdir()
-        except:
-            pass
+async def download_sc_album(url: str, job: Job | None = None, on_volume=None) -> AlbumResult:
+    job = job or Job()
+    with scheduler.tracking(job):
+        with janitor.workdir(DOWNLOAD_DIR, job, "album") as album_dir:
+            return await fetch_album(url, job, album_dir, on_volume)
 
 
-async def run_yt_dlp_with_timeout(url: str, options: dict, timeout: int = 300):
+async def fetch_album(url: str, job: Job, album_dir: Path, on_volume=None) -> AlbumResult:
+    failed_volumes = []
 
-    def _task():
+    async def send_volume(volume: Path):
         try:
-            with yt_dlp.YoutubeDL(options) as ydl:
-                ydl.download([url])
+            await on_volume(volume)
+        except JobCancelled:
+            raise
         except Exception as e:
-            if "Unable to download webpage" in str(e) or "fragment" in str(e).lower():
-                print(f"Первая попытка не удалась: {e}. Пробуем альтернативный метод...")
-                options_copy = options.copy()
-                options_copy.pop('postprocessors', None)
-                options_copy.pop('extractaudio', None)
-                options_copy['format'] = 'best'
-                with yt_dlp.YoutubeDL(options_copy) as ydl_alt:
-                    ydl_alt.download([url])
-            else:
-                raise e
-
-    await asyncio.wait_for(
-        asyncio.get_event_loop().run_in_executor(None, _task),
-        timeout=timeout
+            logger.warning("Не удалось отправить %s: %s", volume.name, e)
+            failed_volumes.append(volume)
+
+    archive = StreamingZip(
+        album_dir / album_dir.name, config.ALBUM_VOLUME_SIZE,
+        send_volume if on_volume is not None else None,
+        platform="soundcloud",
+    )
+    semaphore = asyncio.Semaphore(config.SC_ALBUM_PARALLELISM)
+    track_jobs = []
+
+    async def fetch_track(index: int, track_url: str):
+        job.token.check()
+        track_job = job.child()
+        track_jobs.append(track_job)
+        prefix = f"{index:02d}. "
+        ydl_opts = {
+            'format': AUDIO_FORMAT,
+            'outtmpl': str(album_dir / f'{prefix}%(title)s.%(ext)s'),
+            'quiet': False,
+            'noplaylist': True,
+            'http_chunk_size': 10485760,
+            'retries': 3,
+            'fragment_retries': 3,
+            'skip_unavailable_fragments': True,
+            'socket_timeout': 30,
+            'max_filesize': config.UPLOAD_LIMIT,
+            'extractor_retries': 3,
+            'noprogress': False,
+        }
+        async with semaphore, timed("download", "soundcloud"):
+            job.token.check()
+            await run_yt_dlp_with_timeout(
+                track_url, ydl_opts, timeout=None, job=track_job,
+                platform="soundcloud_album",
+            )
+
+        track_path = find_album_track(album_dir, prefix)
+        if track_path is not None:
+            await asyncio.shield(archive.add(track_path))
+            track_path.unlink()
+
+    tasks = []
+
+    try:
+        async with timed("extract", "soundcloud"):
+            track_urls = await scheduler.run(
+                "soundcloud_album", job, list_album_tracks, url
+            )
+        if not track_urls:
+            raise Exception("Не удалось скачать файлы альбома")
+
+        tasks = [
+            asyncio.create_task(fetch_track(index, track_url))
+            for index, track_url in enumerate(track_urls, 1)
+        ]
+        _, pending = await asyncio.wait(tasks, timeout=config.SC_ALBUM_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        job.token.check()
+        if not pending and any(track.token.cancelled for track in track_jobs):
+            raise JobCancelled()
+        volumes = await archive.finish()
+        if not volumes:
+            if pending:
+                raise asyncio.TimeoutError()
+            raise Exception("Не удалось скачать файлы альбома")
+
+        partial = archive.entries < len(track_urls) or bool(failed_volumes)
+        return AlbumResult(volumes, partial, len(failed_volumes))
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await archive.discard()
+
+
+def run_yt_dlp(url: str, options: dict, token: CancelToken | None = None):
+    options = with_cancel_hooks(options, token)
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            ydl.download([url])
+    except Exception as e:
+        if "fragment" in str(e).lower():
+            logger.warning("Первая попытка не удалась: %s. Пробуем альтернативный метод...", e)
+            options_copy = options.copy()
+            options_copy.pop('postprocessors', None)
+            options_copy.pop('extractaudio', None)
+            options_copy['format'] = 'best'
+            with yt_dlp.YoutubeDL(options_copy) as ydl_alt:
+                ydl_alt.download([url])
+        else:
+            raise e
+
+
+async def run_yt_dlp_with_timeout(
+    url: str,
+    options: dict,
+    timeout: int | None = 300,
+    job: Job | None = None,
+    platform: str = "soundcloud",
+):
+    job = job or Job()
+    await scheduler.run(
+        platform, job, run_yt_dlp, url, options, job.token, timeout=timeout
     )
 
 
-async def download_sc_track_simple(url: str) -> Path:
-    filepath = DOWNLOAD_DIR / f"soundcloud_{uuid.uuid4().hex}.mp3"
+async def download_sc_track_simple(
+    url: str, job: Job | None = None, output_dir: Path | None = None
+) -> Path:
+    job = job or Job()
+    output_dir = output_dir or DOWNLOAD_DIR
+    filepath = output_dir / f"soundcloud_{job.token.marker}.mp3"
 
     ydl_opts = {
-        'format': 'bestaudio/best',
+        'format': AUDIO_FORMAT,
         'outtmpl': str(filepath)[:-4] + '.%(ext)s',
         'quiet': False,
         'noplaylist': True,
-        'extractaudio': False,
-        'audioformat': 'mp3',
         'retries': 2,
         'fragment_retries': 2,
         'skip_unavailable_fragments': True,
         'socket_timeout': 20,
+        'max_filesize': config.UPLOAD_LIMIT,
         'extractor_retries': 2,
     }
 
     try:
-        await run_yt_dlp_with_timeout(url, ydl_opts, timeout=180)
+        async with timed("download", "soundcloud"):
+            await run_yt_dlp_with_timeout(url, ydl_opts, timeout=180, job=job)
 
-        for ext in ['mp3', 'm4a', 'webm']:
+        for ext in AUDIO_EXTENSIONS:
             potential_file = filepath.with_suffix(f'.{ext}')
             if potential_file.exists():
-                if ext != 'mp3':
-                    mp3_file = filepath.with_suffix('.mp3')
-                    await convert_to_mp3(potential_file, mp3_file)
-                    potential_file.unlink()
-                    return mp3_file
-                return potential_file
+                return await telegram_audio(potential_file, job)
 
         raise FileNotFoundError("Скачанный файл не найден")
 
     except Exception as e:
-        for partial_file in DOWNLOAD_DIR.glob(f"{filepath.stem}.*"):
+        for partial_file in output_dir.glob(f"{filepath.stem}.*"):
             try:
                 partial_file.unlink()
             except:
@@ -206,42 +285,101 @@ async def download_sc_track_simple(url: str) -> Path:
         raise e
 
 
-async def convert_to_mp3(input_file: Path, output_file: Path):
+def transcode_audio(
+    input_file: Path, output_file: Path, token: CancelToken | None = None
+):
+    if output_file.suffix == '.m4a':
+        codec = ['-codec:a', 'copy']
+    else:
+        codec = ['-codec:a', 'libmp3lame', '-qscale:a', '2']
+    run_cancellable([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', str(input_file), '-vn', *codec,
+        '-threads', str(config.FFMPEG_THREADS),
+        str(output_file), '-y'
+    ], token)
+
+
+async def convert_audio(input_file: Path, output_file: Path, job: Job | None = None):
+    job = job or Job()
+    async with timed("transcode", "soundcloud"):
+        await scheduler.run(
+            "ffmpeg", job, transcode_audio, input_file, output_file, job.token
+        )
+
+
+async def telegram_audio(file_path: Path, job: Job | None = None) -> Path:
+    if file_path.suffix in PASSTHROUGH_SUFFIXES:
+        return file_path
+
+    target_suffix = '.m4a' if file_path.suffix in REMUX_SUFFIXES else '.mp3'
+    target = file_path.with_suffix(target_suffix)
+    await convert_audio(file_path, target, job)
+    file_path.unlink()
+    return target
+
+
+async def send_album(message: Message, url: str, job: Job, key: str, caption: str):
+    sent_messages = []
+
+    async def send_volume(volume: Path):
+        try:
+            count_bytes("soundcloud", volume)
+            async with timed("upload", "soundcloud"):
+                sent_messages.append(
+                    await message.answer_document(
+                        document=input_file(volume), caption=caption
+                    )
+                )
+        finally:
+            volume.unlink(missing_ok=True)
 
-    def _convert():
-        import subprocess
-        subprocess.run([
-            'ffmpeg', '-i', str(input_file),
-            '-codec:a', 'libmp3lame', '-qscale:a', '2',
-            str(output_file), '-y'
-        ], check=True, capture_output=True)
+    result = await download_sc_album(url, job, on_volume=send_volume)
+    if result.failed:
+        await message.answer(
+            f" Не удалось отправить {result.failed} из {len(result.volumes)} "
+            "частей архива, альбом неполный."
+        )
+    elif result.partial:
+        await message.answer(" Часть треков не успела скачаться, альбом неполный.")
+    else:
+        await file_cache.remember(key, *sent_messages)
 
-    await asyncio.get_event_loop().run_in_executor(None, _convert)
 
+async def upload_sc_track(message: Message, url: str, key: str, job: Job):
+    with janitor.workdir(DOWNLOAD_DIR, job) as workdir:
+        file_path = await download_sc_track_simple(url, job, workdir)
+        async with timed("upload", "soundcloud"):
+            sent = await message.answer_audio(
+                audio=input_file(ensure_uploadable(file_path)),
+                caption=" Скачано! @SaveTTasrobot"
+            )
+        count_bytes("soundcloud", file_path)
+        return await file_cache.remember(key, sent)
 
-@router.message(Command("album"))
-async def handle_sc_album_command(message: Message):
-    if not message.text or len(message.text.split()) < 2:
+
+@router.message(Command("album"), flags={"download": True})
+async def handle_sc_album_command(message: Message, link: MediaLink | None = None):
+    link = link or parse(message.text)
+    if link is None or link.platform != "soundcloud":
         await message.answer("Использование: /album <ссылка на альбом SoundCloud>")
         return
 
-    url = message.text.split()[1].strip()
+    link = await resolve(link)
+    url = link.url
+    key = link.key("album")
+    cached = await file_cache.get(key)
+    if cached:
+        await send_cached(message, cached, " Альбом скачан! @SaveTTasrobot")
+        return
+
     status = await message.answer(" Скачиваю альбом с SoundCloud... Это может занять несколько минут.")
 
     try:
-        file_path = await download_sc_album(url)
-        file_size = file_path.stat().st_size
-
-        if file_size == 0:
-            await message.answer("Не удалось скачать альбом (пустой файл)")
-            file_path.unlink()
-            return
-
-        await message.answer_document(
-            document=FSInputFile(file_path),
-            caption=" Альбом скачан! @SaveTTasrobot"
+        await send_album(
+            message, url, Job(message.from_user.id, status), key,
+            " Альбом скачан! @SaveTTasrobot",
         )
-        file_path.unlink()
     except asyncio.TimeoutError:
         await message.answer(" Таймаут при скачивании альбома. Попробуйте позже или скачайте треки по отдельности.")
     except Exception as e:
@@ -250,17 +388,17 @@ async def handle_sc_album_command(message: Message):
         await status.delete()
 
 
-@router.message(F.text.regexp(r"https?://(www\.)?soundcloud\.com/"))
-async def handle_sc(message: Message):
-
-    url = message.text.strip()
+@router.message(
+    IsLink("soundcloud", "track", "album", "short"),
+    flags={"download": True},
+)
+async def handle_sc(message: Message, link: MediaLink | None = None):
+    link = await resolve(link or parse(message.text))
+    url = link.url
 
+    if link.kind == "album":
 
-    is_album = any(keyword in url.lower() for keyword in ['/sets/', '/playlists/', '/albums/'])
-
-    if is_album:
-
-        url_hash = store_url(url)
+        url_hash = await store_url(url)
 
         keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -276,14 +414,18 @@ async def handle_sc(message: Message):
             reply_markup=keyboard
         )
     else:
+        key = link.key("mp3")
+        cached = await file_cache.get(key)
+        if cached:
+            await send_cached(message, cached, " Скачано! @SaveTTasrobot")
+            return
+
         status = await message.answer(" Скачиваю трек с SoundCloud...")
         try:
-            file_path = await download_sc_track_simple(url)
-            await message.answer_audio(
-                audio=FSInputFile(file_path),
-                caption=" Скачано! @SaveTTasrobot"
+            await deliver(
+                key, " Скачано! @SaveTTasrobot", upload_sc_track,
+                message, url, key, Job(message.from_user.id, status),
             )
-            file_path.unlink()
         except asyncio.TimeoutError:
             await message.answer(" Таймаут при скачивании трека. Попробуйте еще раз.")
         except Exception as e:
@@ -292,55 +434,62 @@ async def handle_sc(message: Message):
             await status.delete()
 
 
-@router.callback_query(F.data.startswith("a_"))
+@router.callback_query(F.data.startswith("a_"), flags={"download": True})
 async def handle_album_callback(callback_query: CallbackQuery):
     url_hash = callback_query.data[2:]
-    url = get_url(url_hash)
+    url = await get_url(url_hash)
 
     if not url:
         await callback_query.message.edit_text(" Ссылка устарела. Отправьте ссылку заново.")
         return
 
-    await callback_query.message.edit_text(" Скачиваю альбом... Это может занять время...")
-
-    try:
-        file_path = await download_sc_album(url)
-        file_size = file_path.stat().st_size
+    key = cache_key("soundcloud", url, "album")
+    cached = await file_cache.get(key)
+    if cached:
+        await send_cached(callback_query.message, cached, "Альбом скачан! @SaveTTasrobot")
+        return
 
-        if file_size == 0:
-            await callback_query.message.answer(" Не удалось скачать альбом (пустой файл)")
-            file_path.unlink()
-            return
+    status_text = " Скачиваю альбом... Это может занять время..."
+    await callback_query.message.edit_text(status_text)
 
-        await callback_query.message.answer_document(
-            document=FSInputFile(file_path),
-            caption="Альбом скачан! @SaveTTasrobot"
+    try:
+        await send_album(
+            callback_query.message,
+            url,
+            Job(callback_query.from_user.id, callback_query.message, status_text),
+            key,
+            "Альбом скачан! @SaveTTasrobot",
         )
-        file_path.unlink()
     except asyncio.TimeoutError:
         await callback_query.message.answer(" Таймаут при скачивании альбома. Попробуйте позже.")
     except Exception as e:
         await callback_query.message.answer(f"Ошибка при скачивании альбома: {str(e)}")
 
 
-@router.callback_query(F.data.startswith("t_"))
+@router.callback_query(F.data.startswith("t_"), flags={"download": True})
 async def handle_track_callback(callback_query: CallbackQuery):
     url_hash = callback_query.data[2:]
-    url = get_url(url_hash)
+    url = await get_url(url_hash)
 
     if not url:
         await callback_query.message.edit_text("Ссылка устарела. Отправьте ссылку заново.")
         return
 
-    await callback_query.message.edit_text(" Скачиваю трек...")
+    key = cache_key("soundcloud", url, "first_track")
+    cached = await file_cache.get(key)
+    if cached:
+        await send_cached(callback_query.message, cached, " Скачано! @SaveTTasrobot")
+        return
+
+    status_text = " Скачиваю трек..."
+    await callback_query.message.edit_text(status_text)
 
     try:
-        file_path = await download_sc_track_simple(url)
-        await callback_query.message.answer_audio(
-            audio=FSInputFile(file_path),
-            caption=" Скачано! @SaveTTasrobot"
+        await deliver(
+            key, " Скачано! @SaveTTasrobot", upload_sc_track,
+            callback_query.message, url, key,
+            Job(callback_query.from_user.id, callback_query.message, status_text),
         )
-        file_path.unlink()
     except asyncio.TimeoutError:
         await callback_query.message.answer("Таймаут при скачивании трека. Попробуйте еще раз.")
     except Exception as e:
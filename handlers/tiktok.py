@@ -1,40 +1,78 @@
 import os
 
 import yt_dlp
-from aiogram import F, Router
-from aiogram.types import FSInputFile, Message
+from aiogram import Router
+from aiogram.types import Message
+
+import config
+
+from services.cancellation import CancelToken, with_cancel_hooks
+from services.file_cache import file_cache, send_cached
+from services.janitor import janitor
+from services.links import IsLink, MediaLink, parse, resolve
+from services.metrics import count_bytes, timed
+from services.scheduler import Job, scheduler
+from services.singleflight import deliver
+from services.uploads import ensure_uploadable, format_filter, input_file
 
 router = Router()
 
+DOWNLOAD_DIR = "downloads/tiktok_downloads"
 
 
-@router.message(
-    F.text.regexp(r"(https?://)?(www\.)?(tiktok\.com|vm\.tiktok\.com|vt\.tiktok\.com)/")
-)
-async def download_tiktok(message: Message):
-    url = message.text.strip()
-    await message.answer("Скачиваю видео с TikTok...")
+def download_tiktok_video(
+    url: str, output_path: str, token: CancelToken | None = None
+) -> str:
+    token = token or CancelToken()
+    os.makedirs(output_path, exist_ok=True)
+    filepath = os.path.join(output_path, f"tiktok_{token.marker}.mp4")
 
-    try:
+    ydl_opts = {
+        "format": f"mp4{format_filter()}/mp4",
+        "outtmpl": filepath,
+        "max_filesize": config.UPLOAD_LIMIT,
+        "quiet": True,
+        "merge_output_format": "mp4",
+    }
+
+    with yt_dlp.YoutubeDL(with_cancel_hooks(ydl_opts, token)) as ydl:
+        ydl.download([url])
 
-        output_dir = "downloads/tiktok_downloads"
-        os.makedirs(output_dir, exist_ok=True)
-        filepath = os.path.join(output_dir, "tiktok.mp4")
+    return filepath
 
-        ydl_opts = {
-            "format": "mp4",
-            "outtmpl": filepath,
-            "quiet": True,
-            "merge_output_format": "mp4",
-        }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+async def upload_tiktok(message: Message, url: str, key: str, job: Job):
+    with janitor.workdir(DOWNLOAD_DIR, job) as workdir:
+        async with timed("download", "tiktok"):
+            filepath = await scheduler.run(
+                "tiktok", job, download_tiktok_video, url, str(workdir), job.token
+            )
+        async with timed("upload", "tiktok"):
+            video = input_file(ensure_uploadable(filepath))
+            sent = await message.answer_video(
+                video, caption="Скачано в @SaveTTasrobot"
+            )
+        count_bytes("tiktok", filepath)
+        return await file_cache.remember(key, sent)
 
-        video = FSInputFile(filepath)
-        await message.answer_video(video, caption="Скачано в @SaveTTasrobot")
 
-        os.remove(filepath)
+@router.message(IsLink("tiktok", "video", "photo", "short"), flags={"download": True})
+async def download_tiktok(message: Message, link: MediaLink | None = None):
+    link = await resolve(link or parse(message.text))
+    url = link.url
+    key = link.key("mp4")
+    cached = await file_cache.get(key)
+    if cached:
+        await send_cached(message, cached, "Скачано в @SaveTTasrobot")
+        return
+
+    status = await message.answer("Скачиваю видео с TikTok...")
+
+    job = Job(message.from_user.id, status)
+    try:
+        await deliver(
+            key, "Скачано в @SaveTTasrobot", upload_tiktok, message, url, key, job
+        )
 
     except Exception as e:
         await message.answer(f"Ошибка при скачивании: {e}")
@@ -1,34 +1,162 @@
-import asyncio
+import logging
 import os
-import uuid
 
 import yt_dlp
 from aiogram import F, Router, types
 from aiogram.types import (
     CallbackQuery,
-    FSInputFile,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
 )
 
+import config
+from services.cancellation import CancelToken, with_cancel_hooks
+from services.file_cache import cache_key, file_cache, media_id, send_cached
+from services.janitor import janitor
+from services.links import IsLink, MediaLink, parse
+from services.metrics import count_bytes, timed
+from services.scheduler import Job, scheduler
+from services.singleflight import deliver
+from services.state_store import MemoryBackend, callback_store
+from services.uploads import (
+    ensure_uploadable,
+    format_filter,
+    input_file,
+    size_label,
+)
+
 router = Router()
+logger = logging.getLogger(__name__)
 
 DOWNLOAD_DIR = "downloads/youtube_downloads"
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-cache = {}
+cache = callback_store("yt")
+
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-us,en;q=0.5",
+    "Accept-Encoding": "gzip,deflate",
+    "Accept-Charset": "ISO-8859-1,utf-8;q=0.7,*;q=0.7",
+    "Connection": "keep-alive",
+}
+PROBE_TIMEOUT = 60
+PROBE_KINDS = {"video", "shorts"}
+DEFAULT_OPTIONS = [("360p", 0), ("720p", 0), ("mp3", 0)]
+
+STALE_INFO_KEYS = (
+    "requested_formats",
+    "requested_downloads",
+    "requested_subtitles",
+    "requested_entries",
+    "filepath",
+    "infojson_filename",
+)
+
+probe_cache = MemoryBackend(config.YT_PROBE_CACHE_SIZE)
+
+
+def probe_youtube(url: str, token: CancelToken | None = None) -> dict:
+    ydl_opts = {
+        "noplaylist": True,
+        "quiet": True,
+        "http_headers": HTTP_HEADERS,
+    }
+    with yt_dlp.YoutubeDL(with_cancel_hooks(ydl_opts, token)) as ydl:
+        info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info, remove_private_keys=True)
+
+
+async def get_info(url: str, user_id: int | None = None) -> dict:
+    video_id = media_id("youtube", url)
+    info = await probe_cache.get(video_id)
+    if info is None:
+        job = Job(user_id)
+        async with timed("extract", "youtube"):
+            info = await scheduler.run(
+                "youtube_probe", job, probe_youtube, url, job.token,
+                timeout=PROBE_TIMEOUT,
+            )
+        await probe_cache.set(video_id, info, config.YT_PROBE_TTL)
+    return info
+
+
+def format_size(fmt: dict, duration: float) -> int:
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if not size and fmt.get("tbr") and duration:
+        size = fmt["tbr"] * 1000 / 8 * duration
+    return int(size or 0)
+
+
+def format_options(info: dict) -> list[tuple[str, int]]:
+    formats = info.get("formats") or []
+    duration = info.get("duration") or 0
+
+    audio = [
+        f for f in formats
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+    ]
+    m4a = [f for f in audio if f.get("ext") == "m4a"] or audio
+    audio_size = max((format_size(f, duration) for f in m4a), default=0)
+
+    options = []
+    video = [f for f in formats if f.get("vcodec") not in (None, "none") and f.get("height")]
+    for height in config.YT_HEIGHTS:
+        candidates = [f for f in video if f["height"] == height]
+        if not candidates:
+            continue
+        candidates = [f for f in candidates if f.get("ext") == "mp4"] or candidates
+        size = max(
+            format_size(f, duration)
+            + (audio_size if f.get("acodec") in (None, "none") else 0)
+            for f in candidates
+        )
+        options.append((f"{height}p", size))
+
+    if not options:
+        return []
+    options.append(("mp3", audio_size))
+    return options
+
+
+def build_keyboard(key: str, options: list[tuple[str, int]]) -> InlineKeyboardMarkup:
+    video_row, audio_row = [], []
+    for fmt, size in options:
+        text = "MP3" if fmt == "mp3" else fmt
+        if size:
+            text = f"{text} · {size_label(size)}"
+        if size > config.UPLOAD_LIMIT:
+            button = InlineKeyboardButton(text=f"🚫 {text}", callback_data="yt:too_big")
+        else:
+            button = InlineKeyboardButton(text=text, callback_data=f"yt:{key}:{fmt}")
+        (audio_row if fmt == "mp3" else video_row).append(button)
+
+    rows = [video_row[i:i + 2] for i in range(0, len(video_row), 2)]
+    return InlineKeyboardMarkup(inline_keyboard=rows + [audio_row])
 
 
-def download_youtube(url: str, output_path: str, format_code: str) -> str:
-    if format_code == "360p":
-        ydl_format = "bestvideo[height<=360][ext=mp4]+bestaudio[ext=m4a]/best[height<=360][ext=mp4]/best"
-    elif format_code == "720p":
-        ydl_format = "bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/best"
-    elif format_code == "Audio":
-        ydl_format = "bestaudio/best"
+def download_youtube(
+    url: str,
+    output_path: str,
+    format_code: str,
+    token: CancelToken | None = None,
+    info: dict | None = None,
+) -> str:
+    fits = format_filter()
+    if format_code.endswith("p") and format_code[:-1].isdigit():
+        height = format_code[:-1]
+        video_fits = format_filter(config.UPLOAD_LIMIT * 9 // 10)
+        ydl_format = (
+            f"bestvideo[height<={height}][ext=mp4]{video_fits}+bestaudio[ext=m4a]"
+            f"/best[height<={height}][ext=mp4]{fits}/best{fits}"
+        )
+    elif format_code in ("mp3", "Audio"):
+        ydl_format = f"bestaudio{fits}/best{fits}"
     else:
-        ydl_format = "best"
+        ydl_format = f"best{fits}"
 
     ydl_opts = {
         "format": ydl_format,
@@ -36,15 +164,9 @@ def download_youtube(url: str, output_path: str, format_code: str) -> str:
         "noplaylist": True,
         "quiet": True,
         "no_warnings": False,
-        "http_headers": {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-us,en;q=0.5",
-            "Accept-Encoding": "gzip,deflate",
-            "Accept-Charset": "ISO-8859-1,utf-8;q=0.7,*;q=0.7",
-            "Connection": "keep-alive",
-        },
+        "http_headers": HTTP_HEADERS,
         "extract_flat": False,
+        "max_filesize": config.UPLOAD_LIMIT,
     }
 
     if format_code == "mp3":
@@ -62,64 +184,95 @@ def download_youtube(url: str, output_path: str, format_code: str) -> str:
             }
         )
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
+    with yt_dlp.YoutubeDL(with_cancel_hooks(ydl_opts, token)) as ydl:
+        if info is not None:
+            info = {k: v for k, v in info.items() if k not in STALE_INFO_KEYS}
+            info = ydl.process_ie_result(info, download=True)
+        else:
+            info = ydl.extract_info(url, download=True)
         filename = ydl.prepare_filename(info)
         if format_code == "mp3":
             filename = os.path.splitext(filename)[0] + ".mp3"
         return filename
 
 
-@router.message(F.text.regexp(r"(https?://)?(www\.)?(youtube\.com|youtu\.be)/"))
-async def youtube_handler(message: Message):
-    url = message.text.strip()
-    video_id = uuid.uuid4().hex[:8]
-    cache[video_id] = {"url": url}
-
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="360p", callback_data=f"yt:{video_id}:360p"),
-                InlineKeyboardButton(text="720p", callback_data=f"yt:{video_id}:720p"),
-            ],
-            [
-                InlineKeyboardButton(text="MP3", callback_data=f"yt:{video_id}:mp3"),
-            ],
-        ]
-    )
+@router.message(IsLink("youtube"), flags={"download": True})
+async def youtube_handler(message: Message, link: MediaLink | None = None):
+    link = link or parse(message.text)
+    url = link.url
+    key = await cache.put(url)
+
+    options = []
+    if link.kind in PROBE_KINDS:
+        try:
+            info = await get_info(url, message.from_user.id)
+            options = format_options(info)
+        except Exception as e:
+            logger.warning("YouTube probe failed: %s", e)
 
+    kb = build_keyboard(key, options or DEFAULT_OPTIONS)
     await message.answer("Выбери формат для скачивания:", reply_markup=kb)
 
 
-@router.callback_query(F.data.startswith("yt:"))
+@router.callback_query(F.data == "yt:too_big")
+async def youtube_too_big(callback: CallbackQuery):
+    await callback.answer(
+        f"Этот формат больше лимита Telegram ({size_label(config.UPLOAD_LIMIT)})",
+        show_alert=True,
+    )
+
+
+async def upload_youtube(message: Message, url: str, fmt: str, key: str, job: Job):
+    info = await probe_cache.get(media_id("youtube", url))
+    with janitor.workdir(DOWNLOAD_DIR, job) as workdir:
+        async with timed("download", "youtube"):
+            filepath = await scheduler.run(
+                "youtube", job, download_youtube, url, str(workdir), fmt, job.token, info
+            )
+        async with timed("upload", "youtube"):
+            file = input_file(ensure_uploadable(filepath))
+            if fmt == "mp3":
+                sent = await message.answer_audio(
+                    file, caption="Скачано в @SaveTTasrobot"
+                )
+            else:
+                sent = await message.answer_video(
+                    file, caption="Скачано в @SaveTTasrobot"
+                )
+        count_bytes("youtube", filepath)
+        return await file_cache.remember(key, sent)
+
+
+@router.callback_query(F.data.startswith("yt:"), flags={"download": True})
 async def youtube_callback(callback: CallbackQuery):
     try:
         _, video_id, fmt = callback.data.split(":")
-        url = cache.get(video_id, {}).get("url")
+        url = await cache.get(video_id)
 
         if not url:
             await callback.message.edit_text("Ссылка устарела, отправь снова.")
             return
 
-        await callback.message.edit_text(f" Скачиваю в формате {fmt}...")
-
-        loop = asyncio.get_event_loop()
-        filepath = await loop.run_in_executor(
-            None, download_youtube, url, DOWNLOAD_DIR, fmt
-        )
-
-        file = FSInputFile(filepath)
+        key = cache_key("youtube", url, fmt)
+        cached = await file_cache.get(key)
+        if cached:
+            await send_cached(callback.message, cached, "Скачано в @SaveTTasrobot")
+            return
 
-        if fmt == "mp3":
-            await callback.message.answer_audio(
-                file, caption="Скачано в @SaveTTasrobot"
-            )
-        else:
-            await callback.message.answer_video(
-                file, caption="Скачано в @SaveTTasrobot"
-            )
+        status_text = f" Скачиваю в формате {fmt}..."
+        await callback.message.edit_text(status_text)
 
-        os.remove(filepath)
+        job = Job(callback.from_user.id, callback.message, status_text)
+        await deliver(
+            key,
+            "Скачано в @SaveTTasrobot",
+            upload_youtube,
+            callback.message,
+            url,
+            fmt,
+            key,
+            job,
+        )
 
     except Exception as e:
         await callback.message.answer(f"Ошибка: {e}")
@@ -1,18 +1,43 @@
 import asyncio
-import os
+import logging
 
-import dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from handlers import (handlers_router, instagram_router, pinterest_router,
-                      soundcloud_router, tiktok_router, youtube_router)
+import config
+from handlers import (handlers_router, inline_router, instagram_router,
+                      pinterest_router, soundcloud_router, tiktok_router,
+                      youtube_router)
 from handlers.handler import set_commands
+from services.file_cache import file_cache
+from services.http_client import http_client
+from services.janitor import janitor
+from services.links import LinkMiddleware
+from services.metrics import metrics_server
+from services.quotas import quota_middleware
+from services.scheduler import scheduler
+from services.state_store import backend as callback_backend
 
-dotenv.load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
+logging.basicConfig(
+    level=config.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
-bot = Bot(token=BOT_TOKEN)
+session = None
+if config.LOCAL_BOT_API:
+    session = AiohttpSession(
+        api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL, is_local=True)
+    )
+
+bot = Bot(token=config.BOT_TOKEN, session=session)
 dp = Dispatcher()
+dp.message.outer_middleware(LinkMiddleware())
+dp.inline_query.outer_middleware(LinkMiddleware())
+dp.message.middleware(quota_middleware)
+dp.callback_query.middleware(quota_middleware)
 
 dp.include_router(handlers_router)
 dp.include_router(soundcloud_router)
@@ -20,12 +45,65 @@ dp.include_router(pinterest_router)
 dp.include_router(tiktok_router)
 dp.include_router(instagram_router)
 dp.include_router(youtube_router)
+dp.include_router(inline_router)
 
 
-async def main():
+@dp.startup()
+async def on_startup(bot: Bot):
+    http_client.open()
+    janitor.start()
+    await metrics_server.start()
     await set_commands(bot)
-    await dp.start_polling(bot)
+    if config.BOT_MODE == "webhook":
+        await bot.set_webhook(
+            f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        await bot.delete_webhook()
+
+
+@dp.shutdown()
+async def on_shutdown():
+    await janitor.stop()
+    await metrics_server.stop()
+    scheduler.shutdown()
+    file_cache.close()
+    await callback_backend.close()
+    await http_client.close()
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response(
+        {
+            "status": "ok",
+            "pools": {
+                name: {"active": active, "queued": queued}
+                for name, (active, queued) in scheduler.stats().items()
+            },
+            "janitor": {"reclaimed_bytes": janitor.reclaimed},
+        }
+    )
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=config.WEBHOOK_SECRET
+    ).register(app, path=config.WEBHOOK_PATH)
+    app.router.add_get("/health", health)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def main():
+    if config.BOT_MODE == "webhook":
+        web.run_app(create_app(), host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    else:
+        asyncio.run(dp.start_polling(bot))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
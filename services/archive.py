@@ -0,0 +1,116 @@
+import asyncio
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from services.metrics import timed
+from services.uploads import FileTooLargeError, size_label
+
+ZIP_ENTRY_OVERHEAD = 30 + 46 + 2 * 28
+ZIP_END_OVERHEAD = 22 + 56 + 20
+
+
+class StreamingZip:
+    def __init__(
+        self,
+        base_path: Path,
+        volume_size: int = 0,
+        on_volume=None,
+        platform: str = "",
+    ):
+        self.base_path = base_path
+        self.platform = platform
+        self.volume_size = volume_size
+        self.on_volume = on_volume
+        self.volumes: list[Path] = []
+        self.entries = 0
+        self.finished = False
+        self._zip = None
+        self._path = None
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zip")
+
+    def _open(self):
+        self._path = self.base_path.with_name(
+            f"{self.base_path.name}.part{len(self.volumes) + 1}.zip"
+        )
+        self._zip = zipfile.ZipFile(self._path, "w", zipfile.ZIP_STORED)
+        self._size = ZIP_END_OVERHEAD
+
+    def _close(self) -> Path:
+        self._zip.close()
+        self._zip = None
+        self.volumes.append(self._path)
+        return self._path
+
+    def _add(self, file_path: Path, arcname: str) -> Path | None:
+        entry_size = (
+            file_path.stat().st_size + ZIP_ENTRY_OVERHEAD + 2 * len(arcname.encode())
+        )
+        if self.volume_size and entry_size + ZIP_END_OVERHEAD > self.volume_size:
+            raise FileTooLargeError(
+                f"{file_path.name} больше тома архива ({size_label(self.volume_size)})"
+            )
+
+        closed = None
+        if (
+            self._zip is not None
+            and self.volume_size
+            and self._zip.namelist()
+            and self._size + entry_size > self.volume_size
+        ):
+            closed = self._close()
+
+        if self._zip is None:
+            self._open()
+        self._zip.write(file_path, arcname)
+        self._size += entry_size
+        self.entries += 1
+        return closed
+
+    def _finish(self) -> Path | None:
+        if self._zip is None:
+            return None
+
+        last = self._close()
+        if len(self.volumes) == 1:
+            single = self.base_path.with_name(f"{self.base_path.name}.zip")
+            last.rename(single)
+            self.volumes[0] = last = single
+        return last
+
+    async def add(self, file_path: Path, arcname: str | None = None):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            async with timed("zip", self.platform):
+                closed = await loop.run_in_executor(
+                    self._executor, self._add, file_path, arcname or file_path.name
+                )
+            if closed is not None and self.on_volume is not None:
+                await self.on_volume(closed)
+
+    async def finish(self) -> list[Path]:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            async with timed("zip", self.platform):
+                last = await loop.run_in_executor(self._executor, self._finish)
+            self.finished = True
+            if last is not None and self.on_volume is not None:
+                await self.on_volume(last)
+        self._executor.shutdown(wait=False)
+        return self.volumes
+
+    def _discard(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+            self._path.unlink(missing_ok=True)
+
+    async def discard(self):
+        if self.finished:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            await loop.run_in_executor(self._executor, self._discard)
+        self._executor.shutdown(wait=False)
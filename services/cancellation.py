@@ -0,0 +1,113 @@
+import os
+import signal
+import threading
+import uuid
+from subprocess import PIPE, CalledProcessError, Popen, TimeoutExpired
+from pathlib import Path
+
+from yt_dlp.utils import DownloadCancelled
+
+
+class JobCancelled(DownloadCancelled):
+    msg = "Загрузка отменена"
+
+
+class CancelToken:
+    def __init__(self, marker: str | None = None):
+        self.marker = marker or uuid.uuid4().hex
+        self.progress = None
+        self._event = threading.Event()
+
+    def __getstate__(self):
+        return {**self.__dict__, "progress": None}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def share(self, event):
+        if self._event.is_set():
+            event.set()
+        self._event = event
+
+    def cancel(self):
+        self._event.set()
+        kill_child_processes(self.marker)
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def hook(self, status: dict):
+        self.check()
+        if self.progress is not None:
+            self.progress(status)
+
+
+def with_cancel_hooks(options: dict, token: CancelToken | None) -> dict:
+    if token is None:
+        return options
+    return {
+        **options,
+        "progress_hooks": [*options.get("progress_hooks", []), token.hook],
+        "postprocessor_hooks": [*options.get("postprocessor_hooks", []), token.hook],
+    }
+
+
+def run_cancellable(command: list[str], token: CancelToken | None, poll: float = 0.5):
+    process = Popen(command, stdout=PIPE, stderr=PIPE)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=poll)
+            break
+        except TimeoutExpired:
+            if token is not None and token.cancelled:
+                process.kill()
+                process.communicate()
+                raise JobCancelled()
+
+    if token is not None and token.cancelled:
+        raise JobCancelled()
+    if process.returncode != 0:
+        raise CalledProcessError(process.returncode, command, stderr=stderr)
+
+
+def _descendants(root_pid: int) -> set[int]:
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    found = set()
+    stack = [root_pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in found:
+                found.add(child)
+                stack.append(child)
+    return found
+
+
+def kill_child_processes(marker: str) -> int:
+    if not marker or not Path("/proc").is_dir():
+        return 0
+
+    killed = 0
+    for pid in _descendants(os.getpid()):
+        try:
+            cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        except OSError:
+            continue
+        if marker.encode() in cmdline:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except OSError:
+                pass
+    return killed
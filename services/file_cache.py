@@ -0,0 +1,174 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from aiogram.types import Message
+
+import config
+from services.links import parse
+from services.metrics import cache_requests
+from services.uploads import send_media
+
+
+class CachedFile(NamedTuple):
+    kind: str
+    file_id: str
+
+
+def media_id(platform: str, url: str) -> str:
+    link = parse(url)
+    if link is not None and link.platform == platform:
+        return link.media_id
+    return url.strip()
+
+
+def cache_key(platform: str, url: str, fmt: str) -> str:
+    return f"{platform}:{media_id(platform, url)}:{fmt}"
+
+
+def file_id_from_message(message: Message) -> CachedFile | None:
+    for kind in ("video", "audio", "document", "animation"):
+        media = getattr(message, kind, None)
+        file_id = getattr(media, "file_id", None)
+        if isinstance(file_id, str):
+            return CachedFile(kind, file_id)
+
+    photos = getattr(message, "photo", None)
+    if isinstance(photos, list) and photos:
+        file_id = getattr(photos[-1], "file_id", None)
+        if isinstance(file_id, str):
+            return CachedFile("photo", file_id)
+    return None
+
+
+class FileIdCache:
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                "key TEXT PRIMARY KEY, files TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS file_ids_created_at ON file_ids (created_at)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def get(self, key: str) -> list[CachedFile]:
+        files = await asyncio.to_thread(self._get, key)
+        platform = key.split(":", 1)[0]
+        cache_requests.inc(platform=platform, result="hit" if files else "miss")
+        return files
+
+    def _get(self, key: str) -> list[CachedFile]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT files, created_at FROM file_ids WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return []
+
+            files, created_at = row
+            if created_at + self.ttl < now:
+                self._touched.pop(key, None)
+                conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+                conn.commit()
+                return []
+
+            self._touched[key] = now
+        return [CachedFile(*item) for item in json.loads(files)]
+
+    def _flush_touched(self, conn: sqlite3.Connection):
+        if self._touched:
+            conn.executemany(
+                "UPDATE file_ids SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    async def set(self, key: str, files: list[CachedFile]):
+        if files:
+            await asyncio.to_thread(self._set, key, files)
+
+    def _set(self, key: str, files: list[CachedFile]):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            self._flush_touched(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO file_ids (key, files, created_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps([list(item) for item in files]), now, now),
+            )
+            conn.execute(
+                "DELETE FROM file_ids WHERE created_at < ?", (now - self.ttl,)
+            )
+            conn.execute(
+                "DELETE FROM file_ids WHERE key IN ("
+                "SELECT key FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    async def remember(self, key: str, *messages: Message) -> list[CachedFile]:
+        files = [file_id_from_message(message) for message in messages]
+        if not all(files):
+            return []
+        await self.set(key, files)
+        return files
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touched(self._conn)
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+
+async def send_cached(message: Message, files: list[CachedFile], caption: str):
+    media = [
+        (item.kind, item.file_id) for item in files if item.kind in ("photo", "video")
+    ]
+    if len(files) > 1 and len(media) == len(files):
+        await send_media(message, media, caption)
+        return
+
+    for item in files:
+        if item.kind == "video":
+            await message.answer_video(item.file_id, caption=caption)
+        elif item.kind == "audio":
+            await message.answer_audio(item.file_id, caption=caption)
+        elif item.kind == "photo":
+            await message.answer_photo(item.file_id, caption=caption)
+        elif item.kind == "animation":
+            await message.answer_animation(item.file_id, caption=caption)
+        else:
+            await message.answer_document(item.file_id, caption=caption)
+
+
+file_cache = FileIdCache(
+    config.FILE_CACHE_PATH, config.FILE_CACHE_TTL, config.FILE_CACHE_MAX_ENTRIES
+)
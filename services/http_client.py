@@ -0,0 +1,47 @@
+import asyncio
+
+import aiohttp
+
+import config
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/91.0.4472.124 Safari/537.36",
+}
+
+
+class HttpClient:
+    def __init__(self):
+        self._session: aiohttp.ClientSession | None = None
+        self._loop = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self.open()
+
+    def open(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=config.HTTP_POOL_SIZE,
+                    limit_per_host=config.HTTP_LIMIT_PER_HOST,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    connect=config.HTTP_CONNECT_TIMEOUT,
+                    sock_read=config.HTTP_READ_TIMEOUT,
+                ),
+                headers=HEADERS,
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
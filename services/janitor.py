@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import config
+from services.scheduler import Job
+
+logger = logging.getLogger(__name__)
+
+
+def disk_usage(path: Path) -> tuple[int, float]:
+    if path.is_file():
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime
+
+    size, mtime = 0, path.stat().st_mtime
+    for item in path.rglob("*"):
+        try:
+            stat = item.stat()
+        except FileNotFoundError:
+            continue
+        mtime = max(mtime, stat.st_mtime)
+        if item.is_file():
+            size += stat.st_size
+    return size, mtime
+
+
+def remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class Janitor:
+    def __init__(self, root: str | Path, ttl: int, quota: int, interval: float):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.quota = quota
+        self.interval = interval
+        self.active: set[Path] = set()
+        self.reclaimed = 0
+        self._task = None
+
+    @contextmanager
+    def workdir(self, base: str | Path, job: Job, prefix: str = "job"):
+        path = Path(base) / f"{prefix}_{job.token.marker}"
+        path.mkdir(parents=True, exist_ok=True)
+        self.active.add(path.resolve())
+        try:
+            yield path
+        finally:
+            self.active.discard(path.resolve())
+            shutil.rmtree(path, ignore_errors=True)
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        if not self.root.is_dir():
+            return entries
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            for entry in directory.iterdir():
+                try:
+                    size, mtime = disk_usage(entry)
+                except FileNotFoundError:
+                    continue
+                entries.append((mtime, size, entry))
+        return entries
+
+    def sweep(self) -> int:
+        now = time.time()
+        reclaimed = 0
+        used = 0
+        candidates = []
+
+        for mtime, size, entry in sorted(self.entries()):
+            if entry.resolve() in self.active:
+                used += size
+            elif now - mtime > self.ttl:
+                remove(entry)
+                reclaimed += size
+            else:
+                used += size
+                candidates.append((size, entry))
+
+        if self.quota:
+            for size, entry in candidates:
+                if used <= self.quota:
+                    break
+                remove(entry)
+                used -= size
+                reclaimed += size
+
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def run(self):
+        while True:
+            try:
+                reclaimed = await asyncio.to_thread(self.sweep)
+                if reclaimed:
+                    logger.info(
+                        "Janitor: освобождено %.1f МБ (всего %.1f МБ)",
+                        reclaimed / (1024 * 1024),
+                        self.reclaimed / (1024 * 1024),
+                    )
+            except Exception:
+                logger.exception("Janitor error")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+janitor = Janitor(
+    config.DOWNLOAD_ROOT,
+    config.JANITOR_TTL,
+    config.JANITOR_QUOTA,
+    config.JANITOR_INTERVAL,
+)
@@ -0,0 +1,208 @@
+import logging
+import re
+from typing import Any, Awaitable, Callable, NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.types import InlineQuery, TelegramObject
+
+from services.http_client import http_client
+from services.state_store import callback_store
+
+URL_REGEX = re.compile(r"(?:https?://)?(?:[\w-]+\.)+[a-z]{2,}(?:/\S*)?", re.IGNORECASE)
+PINTEREST_HOST = re.compile(r"([a-z]{2}\.)?pinterest(\.[a-z]{2,3}){1,2}")
+SHORT_HOSTS = {
+    "vm.tiktok.com": "tiktok",
+    "vt.tiktok.com": "tiktok",
+    "pin.it": "pinterest",
+    "on.soundcloud.com": "soundcloud",
+}
+HOSTS = {
+    "youtube.com": "youtube",
+    "music.youtube.com": "youtube",
+    "youtube-nocookie.com": "youtube",
+    "youtu.be": "youtube",
+    "tiktok.com": "tiktok",
+    "instagram.com": "instagram",
+    "instagr.am": "instagram",
+    "soundcloud.com": "soundcloud",
+}
+YOUTUBE_PREFIXES = {"shorts": "shorts", "live": "video", "embed": "video", "v": "video"}
+INSTAGRAM_KINDS = {"p": "post", "reel": "reel", "reels": "reel", "tv": "tv"}
+INSTAGRAM_PATHS = {"post": "p", "reel": "reel", "tv": "tv"}
+SOUNDCLOUD_ALBUMS = {"sets", "playlists", "albums"}
+
+redirects = callback_store("link")
+logger = logging.getLogger(__name__)
+
+
+class MediaLink(NamedTuple):
+    platform: str
+    media_id: str
+    kind: str
+    url: str
+
+    def key(self, fmt: str) -> str:
+        return f"{self.platform}:{self.media_id}:{fmt}"
+
+
+def parse(text: str) -> MediaLink | None:
+    for match in URL_REGEX.finditer(text or ""):
+        link = parse_url(match.group(0))
+        if link is not None:
+            return link
+    return None
+
+
+def parse_url(url: str) -> MediaLink | None:
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        host = host.removeprefix(prefix)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    page = f"{host}/{'/'.join(segments)}".rstrip("/")
+
+    if host in SHORT_HOSTS:
+        return MediaLink(SHORT_HOSTS[host], page, "short", f"https://{page}")
+    if PINTEREST_HOST.fullmatch(host):
+        return _pinterest(segments, page)
+
+    platform = HOSTS.get(host)
+    if platform == "youtube":
+        return _youtube(host, segments, parse_qs(parts.query), page)
+    if platform == "tiktok":
+        return _tiktok(segments, page)
+    if platform == "instagram":
+        return _instagram(segments, page)
+    if platform == "soundcloud":
+        return _soundcloud(segments, page)
+    return None
+
+
+def _youtube(host: str, segments: list[str], query: dict, page: str) -> MediaLink:
+    kind, video_id = None, None
+    if host == "youtu.be" and segments:
+        kind, video_id = "video", segments[0]
+    elif query.get("v"):
+        kind, video_id = "video", query["v"][0]
+    elif len(segments) > 1 and segments[0] in YOUTUBE_PREFIXES:
+        kind, video_id = YOUTUBE_PREFIXES[segments[0]], segments[1]
+
+    if video_id:
+        return MediaLink(
+            "youtube", video_id, kind, f"https://www.youtube.com/watch?v={video_id}"
+        )
+    if query.get("list"):
+        playlist_id = query["list"][0]
+        return MediaLink(
+            "youtube",
+            playlist_id,
+            "playlist",
+            f"https://www.youtube.com/playlist?list={playlist_id}",
+        )
+    return MediaLink("youtube", page, "page", f"https://{page}")
+
+
+def _tiktok(segments: list[str], page: str) -> MediaLink:
+    if len(segments) >= 3 and segments[1] in ("video", "photo"):
+        return MediaLink(
+            "tiktok",
+            segments[2],
+            segments[1],
+            f"https://www.tiktok.com/{segments[0]}/{segments[1]}/{segments[2]}",
+        )
+    if segments and segments[0] == "t":
+        return MediaLink("tiktok", page, "short", f"https://{page}")
+    return MediaLink("tiktok", page, "page", f"https://{page}")
+
+
+def _instagram(segments: list[str], page: str) -> MediaLink:
+    for index in (0, 1):
+        if len(segments) > index + 1 and segments[index] in INSTAGRAM_KINDS:
+            kind = INSTAGRAM_KINDS[segments[index]]
+            code = segments[index + 1]
+            return MediaLink(
+                "instagram",
+                code,
+                kind,
+                f"https://www.instagram.com/{INSTAGRAM_PATHS[kind]}/{code}/",
+            )
+    return MediaLink("instagram", page, "page", f"https://{page}")
+
+
+def _pinterest(segments: list[str], page: str) -> MediaLink:
+    if len(segments) > 1 and segments[0] == "pin":
+        return MediaLink(
+            "pinterest",
+            segments[1],
+            "pin",
+            f"https://www.pinterest.com/pin/{segments[1]}/",
+        )
+    return MediaLink("pinterest", page, "page", f"https://{page}")
+
+
+def _soundcloud(segments: list[str], page: str) -> MediaLink:
+    path = "/".join(segments)
+    if SOUNDCLOUD_ALBUMS & set(segments[1:]):
+        kind = "album"
+    elif len(segments) >= 2:
+        kind = "track"
+    else:
+        kind = "page"
+    return MediaLink("soundcloud", path or page, kind, f"https://soundcloud.com/{path}")
+
+
+async def follow_redirects(url: str) -> str:
+    async with http_client.session.get(url, allow_redirects=True) as response:
+        return str(response.url)
+
+
+async def resolve(link: MediaLink) -> MediaLink:
+    if link.kind != "short":
+        return link
+
+    target = await redirects.get(link.media_id)
+    if target is None:
+        try:
+            target = await follow_redirects(link.url)
+        except Exception as e:
+            logger.warning("Не удалось раскрыть %s: %s", link.url, e)
+            return link
+        await redirects.set(link.media_id, target)
+
+    resolved = parse(target)
+    if resolved is None or resolved.platform != link.platform:
+        return link
+    return resolved
+
+
+class LinkMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, InlineQuery):
+            data["link"] = parse(event.query)
+        else:
+            data["link"] = parse(event.text or "")
+        return await handler(event, data)
+
+
+class IsLink(Filter):
+    def __init__(self, platform: str, *kinds: str):
+        self.platform = platform
+        self.kinds = set(kinds)
+
+    async def __call__(
+        self, event: TelegramObject, link: MediaLink | None = None
+    ) -> bool:
+        return (
+            link is not None
+            and link.platform == self.platform
+            and (not self.kinds or link.kind in self.kinds)
+        )
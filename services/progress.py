@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from contextlib import suppress
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+import config
+
+
+def format_bytes(size: float) -> str:
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
+def format_progress(status: dict) -> str:
+    done = status.get("downloaded_bytes") or 0
+    total = status.get("total_bytes") or status.get("total_bytes_estimate")
+    parts = []
+    if total:
+        parts.append(f"{min(done / total, 1) * 100:.0f}% из {format_bytes(total)}")
+    else:
+        parts.append(format_bytes(done))
+    if status.get("speed"):
+        parts.append(f"{format_bytes(status['speed'])}/с")
+    if status.get("eta") is not None:
+        minutes, seconds = divmod(int(status["eta"]), 60)
+        parts.append(f"осталось {minutes}:{seconds:02d}")
+    return "⬇️ " + " · ".join(parts)
+
+
+class ProgressReporter:
+    def __init__(
+        self, status: Message, text: str | None = None, interval: float | None = None
+    ):
+        self.status = status
+        self.text = text
+        self.interval = config.PROGRESS_INTERVAL if interval is None else interval
+        self.loop = None
+        self.last_edit = 0.0
+        self.shown = None
+        self._latest = None
+        self._pending = False
+        self._lock = threading.Lock()
+        self._task = None
+
+    def bind(self):
+        self.loop = asyncio.get_running_loop()
+
+    def hook(self, status: dict):
+        if status.get("status") != "downloading" or self.loop is None:
+            return
+        with self._lock:
+            self._latest = status
+            if self._pending:
+                return
+            self._pending = True
+        with suppress(RuntimeError):
+            self.loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self):
+        delay = max(self.last_edit + self.interval - time.monotonic(), 0)
+        self._task = self.loop.create_task(self._flush(delay))
+
+    async def _flush(self, delay: float):
+        await asyncio.sleep(delay)
+        with self._lock:
+            status, self._latest = self._latest, None
+            self._pending = False
+        if status is None:
+            return
+
+        text = format_progress(status)
+        if self.text:
+            text = f"{self.text}\n{text}"
+        if text == self.shown:
+            return
+        self.last_edit = time.monotonic()
+        self.shown = text
+        with suppress(TelegramBadRequest):
+            await self.status.edit_text(text)
+
+    def stop(self):
+        with self._lock:
+            self._latest = None
+            self._pending = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
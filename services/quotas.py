@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import contextmanager, suppress
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+import config
+
+
+class UserSlots:
+    def __init__(self):
+        self.active = 0
+        self.started: deque[float] = deque()
+        self.waiting: deque[asyncio.Event] = deque()
+
+    def prune(self, now: float):
+        while self.started and self.started[0] <= now - 60:
+            self.started.popleft()
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self.waiting and not self.started
+
+
+def format_eta(seconds: float) -> str:
+    if seconds < 60:
+        return f"{max(math.ceil(seconds), 1)} с"
+    return f"{math.ceil(seconds / 60)} мин"
+
+
+class UserQuotaMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        max_jobs: int,
+        per_minute: int,
+        queue_size: int,
+        job_duration: float = 30.0,
+    ):
+        self.max_jobs = max_jobs
+        self.per_minute = per_minute
+        self.queue_size = queue_size
+        self.job_duration = job_duration
+        self.users: dict[int, UserSlots] = {}
+
+    def quota_delay(self, slots: UserSlots) -> float | None:
+        now = time.monotonic()
+        slots.prune(now)
+        if not self.per_minute or len(slots.started) < self.per_minute:
+            return None
+        return slots.started[0] + 60 - now
+
+    def can_start(self, slots: UserSlots) -> bool:
+        return slots.active < self.max_jobs and self.quota_delay(slots) is None
+
+    def eta(self, slots: UserSlots, position: int) -> float:
+        rounds = math.ceil(position / max(self.max_jobs, 1))
+        return max(rounds * self.job_duration, self.quota_delay(slots) or 0)
+
+    def wake(self, slots: UserSlots):
+        for ticket in slots.waiting:
+            ticket.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if not get_flag(data, "download") or user is None:
+            return await handler(event, data)
+
+        slots = self.users.setdefault(user.id, UserSlots())
+        if slots.waiting or not self.can_start(slots):
+            if len(slots.waiting) >= self.queue_size:
+                self.forget(user.id, slots)
+                await reply(
+                    event,
+                    "Слишком много ссылок в очереди. "
+                    "Дождитесь окончания текущих загрузок.",
+                )
+                return None
+            try:
+                await self.wait_turn(event, slots)
+            except BaseException:
+                self.forget(user.id, slots)
+                raise
+
+        started = self.start(slots)
+        try:
+            return await handler(event, data)
+        finally:
+            self.finish(user.id, slots, started)
+
+    def start(self, slots: UserSlots) -> float:
+        started = time.monotonic()
+        slots.active += 1
+        if self.per_minute:
+            slots.started.append(started)
+        return started
+
+    def finish(self, user_id: int, slots: UserSlots, started: float):
+        slots.active -= 1
+        elapsed = time.monotonic() - started
+        self.job_duration = 0.8 * self.job_duration + 0.2 * elapsed
+        self.wake(slots)
+        self.forget(user_id, slots)
+
+    @contextmanager
+    def try_acquire(self, user_id: int):
+        slots = self.users.setdefault(user_id, UserSlots())
+        if slots.waiting or not self.can_start(slots):
+            self.forget(user_id, slots)
+            yield False
+            return
+        started = self.start(slots)
+        try:
+            yield True
+        finally:
+            self.finish(user_id, slots, started)
+
+    def forget(self, user_id: int, slots: UserSlots):
+        slots.prune(time.monotonic())
+        if slots.idle:
+            self.users.pop(user_id, None)
+
+    async def wait_turn(self, event: TelegramObject, slots: UserSlots):
+        ticket = asyncio.Event()
+        slots.waiting.append(ticket)
+        status = None
+        shown = None
+        try:
+            while True:
+                ticket.clear()
+                position = slots.waiting.index(ticket) + 1
+                if position == 1 and self.can_start(slots):
+                    break
+
+                text = (
+                    f"⏳ Ваша ссылка в очереди: {position}, "
+                    f"примерно через {format_eta(self.eta(slots, position))}"
+                )
+                if text != shown:
+                    status = await show_status(event, status, text)
+                    shown = text
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(ticket.wait(), self.quota_delay(slots))
+        finally:
+            slots.waiting.remove(ticket)
+            self.wake(slots)
+            if status is not None:
+                with suppress(TelegramBadRequest):
+                    await status.delete()
+
+
+async def reply(event: TelegramObject, text: str) -> Message | None:
+    if isinstance(event, CallbackQuery):
+        event = event.message
+    if isinstance(event, Message):
+        return await event.answer(text)
+    return None
+
+
+async def show_status(
+    event: TelegramObject, status: Message | None, text: str
+) -> Message | None:
+    if status is None:
+        return await reply(event, text)
+    with suppress(TelegramBadRequest):
+        await status.edit_text(text)
+    return status
+
+
+quota_middleware = UserQuotaMiddleware(
+    config.USER_MAX_JOBS, config.USER_JOBS_PER_MINUTE, config.USER_QUEUE_SIZE
+)
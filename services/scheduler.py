@@ -0,0 +1,287 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import signal
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+import config
+from services.cancellation import CancelToken, JobCancelled
+from services.metrics import jobs_in_flight, queue_depth
+from services.progress import ProgressReporter
+from services.throttle import guards
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def warm_up_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from yt_dlp.extractor import gen_extractor_classes
+
+    gen_extractor_classes()
+
+
+class Job:
+    def __init__(
+        self,
+        user_id: int | None = None,
+        status: Message | None = None,
+        status_text: str | None = None,
+        parent: "Job | None" = None,
+    ):
+        self.user_id = user_id
+        self.parent = parent
+        self.children: list[Job] = []
+        self.status = status
+        self.status_text = status_text or getattr(status, "text", None)
+        self.was_queued = False
+        self.token = CancelToken()
+        self.progress = None
+        if status is not None:
+            self.progress = ProgressReporter(status, self.status_text)
+            self.token.progress = self.progress.hook
+        self._ticket = None
+
+    def child(self) -> "Job":
+        job = Job(self.user_id, parent=self)
+        self.children.append(job)
+        if self.token.cancelled:
+            job.token.cancel()
+        return job
+
+    def cancel(self):
+        self.token.cancel()
+        if self._ticket is not None and not self._ticket.done():
+            self._ticket.cancel()
+        for child in self.children:
+            child.cancel()
+
+    async def notify_queued(self, position: int):
+        self.was_queued = True
+        if self.status is None:
+            return
+        with suppress(TelegramBadRequest):
+            await self.status.edit_text(
+                f"⏳ Все загрузчики заняты, вы в очереди: {position}"
+            )
+
+    async def notify_started(self):
+        if not self.was_queued or self.status is None or not self.status_text:
+            return
+        with suppress(TelegramBadRequest):
+            await self.status.edit_text(self.status_text)
+
+
+class PlatformPool:
+    def __init__(
+        self, name: str, workers: int, max_queue: int, use_processes: bool = False
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.active = 0
+        self.use_processes = use_processes
+        self._manager = None
+        if use_processes:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up_worker,
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"download-{name}"
+            )
+        self._waiting: OrderedDict = OrderedDict()
+        self.report()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(jobs) for jobs in self._waiting.values())
+
+    def position(self, user_id) -> int:
+        own = len(self._waiting.get(user_id, ()))
+        position = own + 1
+        seen_user = False
+        for waiting_user, jobs in self._waiting.items():
+            if waiting_user == user_id:
+                seen_user = True
+                continue
+            position += min(len(jobs), own if seen_user else own + 1)
+        return position
+
+    def report(self):
+        queue_depth.set(self.queued, pool=self.name)
+        jobs_in_flight.set(self.active, pool=self.name)
+
+    async def acquire(self, job: Job):
+        if self.active < self.workers and not self._waiting:
+            self.active += 1
+            self.report()
+            return
+
+        if self.queued >= self.max_queue:
+            raise QueueFullError(
+                "Очередь загрузок переполнена, попробуйте через пару минут"
+            )
+
+        position = self.position(job.user_id)
+        ticket = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(job.user_id, deque()).append(ticket)
+        job._ticket = ticket
+        self.report()
+
+        try:
+            await job.notify_queued(position)
+            await ticket
+        except asyncio.CancelledError:
+            if ticket.done() and not ticket.cancelled():
+                self.release()
+            else:
+                self._discard(job.user_id, ticket)
+            if job.token.cancelled:
+                raise JobCancelled() from None
+            raise
+        finally:
+            job._ticket = None
+
+        await job.notify_started()
+
+    def _discard(self, user_id, ticket):
+        jobs = self._waiting.get(user_id)
+        if jobs is None:
+            return
+        with suppress(ValueError):
+            jobs.remove(ticket)
+        if not jobs:
+            del self._waiting[user_id]
+        self.report()
+
+    def release(self):
+        while self._waiting:
+            user_id, jobs = next(iter(self._waiting.items()))
+            ticket = jobs.popleft()
+            if jobs:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+            if not ticket.done():
+                ticket.set_result(None)
+                self.report()
+                return
+        self.active -= 1
+        self.report()
+
+    def share_token(self, token: CancelToken):
+        if not self.use_processes:
+            return
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        token.share(self._manager.Event())
+
+    async def run(self, job: Job, func, *args, timeout: float | None = None):
+        job.token.check()
+        await self.acquire(job)
+        loop = asyncio.get_running_loop()
+        try:
+            job.token.check()
+            self.share_token(job.token)
+            if job.progress is not None:
+                job.progress.bind()
+            future = self.executor.submit(functools.partial(func, *args))
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+
+        result = asyncio.wrap_future(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(result), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            job.cancel()
+            result.add_done_callback(lambda done: done.cancelled() or done.exception())
+            await asyncio.wait({result}, timeout=config.CANCEL_GRACE_PERIOD)
+            raise
+        finally:
+            if job.progress is not None:
+                job.progress.stop()
+
+
+class DownloadScheduler:
+    def __init__(
+        self,
+        workers: dict[str, int],
+        max_queue: int,
+        process_platforms: set[str] = frozenset(),
+    ):
+        unknown = set(process_platforms) - set(workers)
+        if unknown:
+            logger.warning(
+                "PROCESS_POOL_PLATFORMS: неизвестные пулы %s пропущены",
+                ", ".join(sorted(unknown)),
+            )
+        self.pools = {
+            name: PlatformPool(name, count, max_queue, name in process_platforms)
+            for name, count in workers.items()
+        }
+        self.jobs: dict[int | None, set[Job]] = {}
+
+    async def run(
+        self,
+        platform: str,
+        job: Job | None,
+        func,
+        *args,
+        timeout: float | None = None,
+    ):
+        job = job or Job()
+        pool = self.pools[platform]
+        with self.tracking(job):
+            guard = guards.get(platform)
+            if guard is None:
+                return await pool.run(job, func, *args, timeout=timeout)
+            return await guard.call(pool.run, job, func, *args, timeout=timeout)
+
+    @contextmanager
+    def tracking(self, job: Job):
+        user_jobs = self.jobs.setdefault(job.user_id, set())
+        if job in user_jobs:
+            yield job
+            return
+        user_jobs.add(job)
+        try:
+            yield job
+        finally:
+            user_jobs.discard(job)
+            if not user_jobs and self.jobs.get(job.user_id) is user_jobs:
+                del self.jobs[job.user_id]
+
+    def cancel_user(self, user_id: int) -> int:
+        user_jobs = list(self.jobs.get(user_id, ()))
+        for job in user_jobs:
+            job.cancel()
+        return sum(job.parent not in user_jobs for job in user_jobs)
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        return {name: (pool.active, pool.queued) for name, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.executor.shutdown(wait=False, cancel_futures=True)
+            if pool._manager is not None:
+                pool._manager.shutdown()
+
+
+scheduler = DownloadScheduler(
+    config.DOWNLOAD_WORKERS, config.DOWNLOAD_QUEUE_SIZE, config.PROCESS_POOL_PLATFORMS
+)
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from aiogram.types import Message
+
+from services.cancellation import JobCancelled
+from services.file_cache import CachedFile, send_cached
+
+Upload = Callable[..., Awaitable[list[CachedFile]]]
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def run(self, key: str, func: Callable[..., Awaitable], *args):
+        while key in self._calls:
+            future = self._calls[key]
+            try:
+                return await asyncio.shield(future), True
+            except (asyncio.CancelledError, JobCancelled):
+                if not future.done():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+
+async def deliver(key: str, caption: str, upload: Upload, message: Message, *args):
+    files, shared = await flights.run(key, upload, message, *args)
+    if not shared:
+        return
+    if files:
+        await send_cached(message, files, caption)
+    else:
+        await upload(message, *args)
+
+
+flights = SingleFlight()
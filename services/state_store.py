@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+import config
+
+
+class StateStoreError(Exception):
+    pass
+
+
+class MemoryBackend:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def get(self, key: str) -> str | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._items[key] = (value, time.time() + ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._items.pop(key, None)
+
+    async def close(self):
+        self._items.clear()
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, max_size: int, prune_interval: float = 60.0):
+        self.path = path
+        self.max_size = max_size
+        self.prune_interval = prune_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._count = None
+        self._pruned_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS callback_state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS callback_state_last_used "
+                "ON callback_state (last_used)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS callback_state_expires_at "
+                "ON callback_state (expires_at)"
+            )
+            self._conn = conn
+            self._count = conn.execute(
+                "SELECT COUNT(*) FROM callback_state"
+            ).fetchone()[0]
+        return self._conn
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM callback_state WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._delete_key(conn, key)
+                conn.commit()
+                return None
+            conn.execute(
+                "UPDATE callback_state SET last_used = ? WHERE key = ?", (now, key)
+            )
+            conn.commit()
+        return row[0]
+
+    def _set(self, key: str, value: str, ttl: int):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO callback_state (key, value, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._count += 1
+            if self._count > self.max_size or now - self._pruned_at > self.prune_interval:
+                self._prune(conn, now)
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM callback_state WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM callback_state WHERE key IN ("
+            "SELECT key FROM callback_state ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+        self._count = conn.execute("SELECT COUNT(*) FROM callback_state").fetchone()[0]
+        self._pruned_at = now
+
+    def _delete_key(self, conn: sqlite3.Connection, key: str):
+        cursor = conn.execute("DELETE FROM callback_state WHERE key = ?", (key,))
+        self._count -= cursor.rowcount
+
+    def _delete(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            self._delete_key(conn, key)
+            conn.commit()
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._count = None
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", str(self.db))
+
+    async def _roundtrip(self, *args: str):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(payload))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis закрыл соединение")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise StateStoreError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if prefix == b"*":
+            return [await self._read_reply() for _ in range(int(body))]
+        raise StateStoreError(f"Неизвестный ответ Redis: {line!r}")
+
+    async def _command(self, *args: str):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        await self._connect()
+                    return await self._roundtrip(*args)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    self._reset()
+                    if attempt:
+                        raise
+                except BaseException:
+                    self._reset()
+                    raise
+
+    def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    async def get(self, key: str) -> str | None:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self._command("SET", key, value, "EX", str(ttl))
+
+    async def delete(self, key: str):
+        await self._command("DEL", key)
+
+    async def close(self):
+        self._reset()
+
+
+def create_backend(kind: str):
+    if kind == "memory":
+        return MemoryBackend(config.CALLBACK_STORE_MAX_SIZE)
+    if kind == "sqlite":
+        return SQLiteBackend(config.CALLBACK_STORE_PATH, config.CALLBACK_STORE_MAX_SIZE)
+    if kind == "redis":
+        return RedisBackend(config.CALLBACK_STORE_URL)
+    raise ValueError(f"Неизвестный CALLBACK_STORE: {kind}")
+
+
+class CallbackStore:
+    def __init__(self, backend, namespace: str, ttl: int):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(value: str) -> str:
+        return hashlib.md5(value.encode()).hexdigest()[:10]
+
+    async def put(self, value: str) -> str:
+        key = self.make_key(value)
+        await self.set(key, value)
+        return key
+
+    async def set(self, key: str, value: str):
+        await self.backend.set(f"{self.namespace}:{key}", value, self.ttl)
+
+    async def get(self, key: str) -> str | None:
+        return await self.backend.get(f"{self.namespace}:{key}")
+
+    async def delete(self, key: str):
+        await self.backend.delete(f"{self.namespace}:{key}")
+
+
+backend = create_backend(config.CALLBACK_STORE)
+
+
+def callback_store(namespace: str) -> CallbackStore:
+    return CallbackStore(backend, namespace, config.CALLBACK_STORE_TTL)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+
+import aiohttp
+from yt_dlp.utils import DownloadError, ExtractorError
+
+import config
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MARKERS = (
+    "429",
+    "too many requests",
+    "rate limit",
+    "rate-limit",
+    "please wait a few minutes",
+)
+
+PLATFORM_FAILURE_MARKERS = (
+    "timed out",
+    "connection",
+    "login required",
+    "blocked",
+)
+UNAVAILABLE_MARKERS = (
+    "not found",
+    "unavailable",
+    "does not exist",
+    "private",
+    "removed",
+)
+HTTP_STATUS_REGEX = re.compile(r"http error (\d{3})")
+PLATFORM_NAMES = {
+    "youtube": "YouTube",
+    "tiktok": "TikTok",
+    "instagram": "Instagram",
+    "soundcloud": "SoundCloud",
+    "soundcloud_album": "SoundCloud",
+    "pinterest": "Pinterest",
+}
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    text = str(error).lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+class AdaptiveThrottle:
+    def __init__(self, base_delay: float, max_delay: float):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+
+    async def wait(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+    def penalize(self):
+        self.delay = min(max(self.delay * 2, self.base_delay), self.max_delay)
+
+    def relax(self):
+        self.delay = self.delay / 2 if self.delay > self.base_delay else 0.0
+
+    async def call(self, func, *args, retries: int | None = None):
+        retries = config.THROTTLE_RETRIES if retries is None else retries
+        for attempt in range(retries + 1):
+            await self.wait()
+            try:
+                result = await func(*args)
+            except Exception as e:
+                if attempt == retries or not is_rate_limited(e):
+                    raise
+                self.penalize()
+                logger.warning("Rate limit, повтор через %.0f с: %s", self.delay, e)
+            else:
+                self.relax()
+                return result
+
+
+throttles = {
+    "instagram": AdaptiveThrottle(
+        config.THROTTLE_BASE_DELAY, config.THROTTLE_MAX_DELAY
+    ),
+}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_platform_failure(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, aiohttp.ClientError)):
+        return True
+    if not isinstance(error, (DownloadError, ExtractorError)):
+        return False
+
+    text = str(error).lower()
+    if is_rate_limited(error):
+        return True
+    status = HTTP_STATUS_REGEX.search(text)
+    if status is not None:
+        code = int(status.group(1))
+        return code == 403 or code >= 500
+    if any(marker in text for marker in UNAVAILABLE_MARKERS):
+        return False
+    return any(marker in text for marker in PLATFORM_FAILURE_MARKERS)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: float,
+        min_calls: int,
+        failure_ratio: float,
+        cooldown: float,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self._calls: deque[tuple[float, bool]] = deque()
+
+    def before(self):
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return
+        raise CircuitOpenError(
+            f"{self.name} сейчас не отвечает, попробуйте через "
+            f"{max(int(remaining), 1)} с"
+        )
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.state == "half_open":
+            self.probing = False
+            if ok:
+                self.state = "closed"
+                self._calls.clear()
+            else:
+                self.trip(now)
+            return
+
+        self._calls.append((now, ok))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+        failures = sum(1 for _, success in self._calls if not success)
+        if (
+            len(self._calls) >= self.min_calls
+            and failures / len(self._calls) >= self.failure_ratio
+        ):
+            self.trip(now)
+
+    def release(self):
+        if self.state == "half_open":
+            self.probing = False
+
+    def trip(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self._calls.clear()
+        logger.warning(
+            "Circuit breaker: %s отключён на %.0f с", self.name, self.cooldown
+        )
+
+    def reset(self):
+        self.state = "closed"
+        self.probing = False
+        self._calls.clear()
+
+
+class PlatformGuard:
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker):
+        self.bucket = bucket
+        self.breaker = breaker
+
+    async def call(self, func, *args, **kwargs):
+        self.breaker.before()
+        try:
+            await self.bucket.acquire()
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            if isinstance(e, Exception) and is_platform_failure(e):
+                self.breaker.record(False)
+            else:
+                self.breaker.release()
+            raise
+        self.breaker.record(True)
+        return result
+
+
+guards = {
+    platform: PlatformGuard(
+        TokenBucket(rate, config.RATE_LIMIT_BURST),
+        CircuitBreaker(
+            PLATFORM_NAMES.get(platform, platform),
+            config.BREAKER_WINDOW,
+            config.BREAKER_MIN_CALLS,
+            config.BREAKER_FAILURE_RATIO,
+            config.BREAKER_COOLDOWN,
+        ),
+    )
+    for platform, rate in config.RATE_LIMITS.items()
+}
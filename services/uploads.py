@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.types import (FSInputFile, InputFile, InputMediaPhoto,
+                           InputMediaVideo, Message)
+from aiohttp import StreamReader
+
+import config
+from services.cancellation import CancelToken
+
+
+MEDIA_GROUP_SIZE = 10
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+def size_label(size: int) -> str:
+    return f"{size / (1024 * 1024):.0f} МБ"
+
+
+def format_filter(limit: int | None = None) -> str:
+    limit = limit or config.UPLOAD_LIMIT
+    return f"[filesize<?{limit}][filesize_approx<?{limit}]"
+
+
+def ensure_uploadable(path: str | Path) -> str | Path:
+    if not os.path.exists(path):
+        raise FileNotFoundError("Скачанный файл не найден")
+    if os.path.getsize(path) > config.UPLOAD_LIMIT:
+        raise FileTooLargeError(
+            f"Файл {size_label(os.path.getsize(path))} больше лимита Telegram "
+            f"({size_label(config.UPLOAD_LIMIT)})"
+        )
+    return path
+
+
+def input_file(path: str | Path) -> FSInputFile | str:
+    if config.LOCAL_BOT_API:
+        return Path(path).resolve().as_uri()
+    return FSInputFile(path)
+
+
+class StreamInputFile(InputFile):
+    def __init__(
+        self,
+        stream: StreamReader,
+        filename: str,
+        chunk_size: int | None = None,
+        token: CancelToken | None = None,
+    ):
+        super().__init__(filename, chunk_size or config.RELAY_CHUNK_SIZE)
+        self.stream = stream
+        self.token = token
+
+    async def read(self, bot: Bot):
+        async for chunk in self.stream.iter_chunked(self.chunk_size):
+            if self.token:
+                self.token.check()
+            yield chunk
+
+
+async def send_media(
+    message: Message, items: list[tuple[str, InputFile | str]], caption: str
+) -> list[Message]:
+    sent = []
+    for start in range(0, len(items), MEDIA_GROUP_SIZE):
+        chunk = items[start:start + MEDIA_GROUP_SIZE]
+        text = caption if start == 0 else None
+        if len(chunk) == 1:
+            kind, media = chunk[0]
+            answer = message.answer_video if kind == "video" else message.answer_photo
+            sent.append(await answer(media, caption=text))
+            continue
+
+        group = [
+            (InputMediaVideo if kind == "video" else InputMediaPhoto)(
+                media=media, caption=text if index == 0 else None
+            )
+            for index, (kind, media) in enumerate(chunk)
+        ]
+        sent.extend(await message.answer_media_group(group))
+    return sent
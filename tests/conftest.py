@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+os.environ.setdefault("FILE_CACHE_PATH", ":memory:")
+os.environ.setdefault("CALLBACK_STORE", "memory")
+
+
+@pytest.fixture(autouse=True)
+def reset_platform_guards():
+    from services.throttle import guards
+
+    for guard in guards.values():
+        guard.breaker.reset()
+    yield
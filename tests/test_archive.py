@@ -0,0 +1,73 @@
+import zipfile
+
+import pytest
+
+from services.archive import StreamingZip
+from services.uploads import FileTooLargeError
+
+
+def make_track(path, size):
+    path.write_bytes(b"\x00" * size)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_single_volume_is_stored_and_renamed(tmp_path):
+    archive = StreamingZip(tmp_path / "album")
+    await archive.add(make_track(tmp_path / "01. a.mp3", 1000))
+    await archive.add(make_track(tmp_path / "02. b.mp3", 1000))
+
+    volumes = await archive.finish()
+
+    assert volumes == [tmp_path / "album.zip"]
+    with zipfile.ZipFile(volumes[0]) as result:
+        assert result.namelist() == ["01. a.mp3", "02. b.mp3"]
+        assert all(
+            info.compress_type == zipfile.ZIP_STORED for info in result.infolist()
+        )
+
+
+@pytest.mark.asyncio
+async def test_volumes_are_emitted_under_limit(tmp_path):
+    sent = []
+
+    async def on_volume(volume):
+        sent.append(volume)
+
+    archive = StreamingZip(tmp_path / "album", volume_size=2500, on_volume=on_volume)
+    for index in range(3):
+        await archive.add(make_track(tmp_path / f"{index}.mp3", 1000))
+        assert len(sent) == (1 if index == 2 else 0)
+
+    volumes = await archive.finish()
+
+    assert sent == volumes == [
+        tmp_path / "album.part1.zip",
+        tmp_path / "album.part2.zip",
+    ]
+    assert all(volume.stat().st_size <= 2500 for volume in volumes)
+    assert archive.entries == 3
+
+
+@pytest.mark.asyncio
+async def test_discard_removes_unfinished_volume(tmp_path):
+    archive = StreamingZip(tmp_path / "album")
+    await archive.add(make_track(tmp_path / "a.mp3", 10))
+
+    await archive.discard()
+
+    assert not (tmp_path / "album.part1.zip").exists()
+
+
+@pytest.mark.asyncio
+async def test_track_larger_than_volume_is_rejected(tmp_path):
+    archive = StreamingZip(tmp_path / "album", volume_size=1000)
+    await archive.add(make_track(tmp_path / "a.mp3", 100))
+
+    with pytest.raises(FileTooLargeError):
+        await archive.add(make_track(tmp_path / "b.mp3", 1000))
+
+    volumes = await archive.finish()
+    assert archive.entries == 1
+    with zipfile.ZipFile(volumes[0]) as result:
+        assert result.namelist() == ["a.mp3"]
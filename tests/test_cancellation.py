@@ -0,0 +1,68 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from services.cancellation import (CancelToken, JobCancelled,
+                                   kill_child_processes, run_cancellable,
+                                   with_cancel_hooks)
+
+
+def test_hooks_raise_after_cancel():
+    token = CancelToken()
+    options = with_cancel_hooks({"progress_hooks": ["existing"]}, token)
+
+    assert options["progress_hooks"][0] == "existing"
+    options["progress_hooks"][-1]({"status": "downloading"})
+
+    token.cancel()
+    with pytest.raises(JobCancelled):
+        options["postprocessor_hooks"][-1]({"status": "started"})
+
+
+def test_with_cancel_hooks_without_token():
+    options = {"format": "mp4"}
+
+    assert with_cancel_hooks(options, None) is options
+
+
+def test_run_cancellable_kills_process():
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        run_cancellable([sys.executable, "-c", "import time; time.sleep(30)"], token)
+
+    assert time.monotonic() - started < 5
+
+
+def test_run_cancellable_reports_failure():
+    with pytest.raises(subprocess.CalledProcessError):
+        run_cancellable([sys.executable, "-c", "raise SystemExit(3)"], CancelToken())
+
+
+def test_run_cancellable_prefers_cancel_over_exit_code():
+    token = CancelToken()
+    token.cancel()
+
+    with pytest.raises(JobCancelled):
+        run_cancellable([sys.executable, "-c", "raise SystemExit(-9)"], token)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="uses /proc")
+def test_kill_child_processes_matches_marker():
+    marker = CancelToken().marker
+    target = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(30)", marker]
+    )
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        assert kill_child_processes(marker) == 1
+        assert target.wait(5) != 0
+        assert other.poll() is None
+    finally:
+        other.kill()
+        other.wait()
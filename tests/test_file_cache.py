@@ -0,0 +1,120 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services.file_cache import (CachedFile, FileIdCache, cache_key,
+                                 file_id_from_message, send_cached)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    file_cache = FileIdCache(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=2)
+    yield file_cache
+    file_cache.close()
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=tracking",
+        "https://youtu.be/dQw4w9WgXcQ?si=abc",
+        "youtube.com/shorts/dQw4w9WgXcQ",
+        "https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+    ],
+)
+def test_youtube_cache_key_variants(url):
+    assert cache_key("youtube", url, "720p") == "youtube:dQw4w9WgXcQ:720p"
+
+
+def test_cache_key_strips_tracking_query():
+    assert cache_key(
+        "instagram", "https://www.instagram.com/reel/abc123/?igsh=xyz", "media"
+    ) == "instagram:abc123:media"
+
+
+@pytest.mark.asyncio
+async def test_set_and_get(cache):
+    await cache.set("tiktok:1:mp4", [CachedFile("video", "FILE1")])
+
+    assert await cache.get("tiktok:1:mp4") == [CachedFile("video", "FILE1")]
+    assert await cache.get("tiktok:2:mp4") == []
+
+
+@pytest.mark.asyncio
+async def test_ttl_expiry(cache):
+    with patch("services.file_cache.time.time", return_value=1000):
+        await cache.set("key", [CachedFile("audio", "FILE")])
+
+    with patch("services.file_cache.time.time", return_value=1061):
+        assert await cache.get("key") == []
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(cache):
+    cache.ttl = 10**10
+    with patch("services.file_cache.time.time", side_effect=[1, 2, 3, 4]):
+        await cache.set("a", [CachedFile("video", "A")])
+        await cache.set("b", [CachedFile("video", "B")])
+        await cache.get("a")
+        await cache.set("c", [CachedFile("video", "C")])
+
+    assert await cache.get("a")
+    assert await cache.get("b") == []
+    assert await cache.get("c")
+
+
+@pytest.mark.asyncio
+async def test_hits_do_not_write_until_next_set(cache):
+    await cache.set("a", [CachedFile("video", "A")])
+    conn = cache._connect()
+    before = conn.total_changes
+
+    await cache.get("a")
+
+    assert conn.total_changes == before
+    assert "a" in cache._touched
+    await cache.set("b", [CachedFile("video", "B")])
+    assert not cache._touched
+
+
+@pytest.mark.asyncio
+async def test_remember_skips_messages_without_media(cache):
+    message = MagicMock()
+    await cache.remember("key", message)
+
+    assert await cache.get("key") == []
+
+
+def test_file_id_from_message_photo():
+    message = MagicMock(video=None, audio=None, document=None, animation=None)
+    message.photo = [MagicMock(file_id="small"), MagicMock(file_id="large")]
+
+    assert file_id_from_message(message) == CachedFile("photo", "large")
+
+
+@pytest.mark.asyncio
+async def test_send_cached_dispatches_by_kind():
+    message = AsyncMock()
+
+    await send_cached(
+        message, [CachedFile("video", "V"), CachedFile("audio", "A")], "caption"
+    )
+
+    message.answer_video.assert_called_once_with("V", caption="caption")
+    message.answer_audio.assert_called_once_with("A", caption="caption")
+
+
+@pytest.mark.asyncio
+async def test_send_cached_groups_photos_and_videos():
+    message = AsyncMock()
+    files = [CachedFile("photo", f"P{i}") for i in range(11)] + [CachedFile("video", "V")]
+
+    await send_cached(message, files, "caption")
+
+    assert message.answer_media_group.call_count == 2
+    first, second = (call.args[0] for call in message.answer_media_group.call_args_list)
+    assert [item.media for item in first] == [f"P{i}" for i in range(10)]
+    assert first[0].caption == "caption"
+    assert [item.media for item in second] == ["P10", "V"]
+    assert second[0].caption is None
+    message.answer_photo.assert_not_called()
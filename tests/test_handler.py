@@ -1,8 +1,8 @@
 import pytest
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 from aiogram.types import Message
 
-from handlers.handler import start_bot, set_commands
+from handlers.handler import cancel_downloads, start_bot, set_commands
 
 class TestStartBot:
     @pytest.mark.asyncio
@@ -33,6 +33,29 @@ class TestStartBot:
 
         bot.set_my_commands.assert_called_once()
         commands = bot.set_my_commands.call_args[0][0]
-        assert len(commands) == 1
+        assert len(commands) == 2
         assert commands[0].command == "start"
-        assert commands[0].description == "Запустить бота 🚀"
\ No newline at end of file
+        assert commands[0].description == "Запустить бота 🚀"
+        assert commands[1].command == "cancel"
+
+
+class TestCancelDownloads:
+    @pytest.mark.asyncio
+    async def test_cancel_reports_count(self):
+        message = AsyncMock()
+        message.from_user.id = 42
+
+        with patch("handlers.handler.scheduler.cancel_user", return_value=2) as cancel:
+            await cancel_downloads(message)
+
+        cancel.assert_called_once_with(42)
+        assert "2" in message.answer.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_cancel_without_jobs(self):
+        message = AsyncMock()
+        message.from_user.id = 42
+
+        await cancel_downloads(message)
+
+        message.answer.assert_called_once_with("Нет активных загрузок.")
@@ -0,0 +1,55 @@
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services.http_client import HttpClient
+from services.links import follow_redirects
+
+
+@pytest_asyncio.fixture
+async def server():
+    async def short(request):
+        raise web.HTTPFound("/pin/123456/")
+
+    async def pin(request):
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/abc", short)
+    app.router.add_get("/pin/123456/", pin)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_session_is_shared_and_closed():
+    client = HttpClient()
+    session = client.session
+
+    assert client.session is session
+
+    await client.close()
+    assert session.closed
+    assert client.session is not session
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused(server):
+    client = HttpClient()
+    for _ in range(3):
+        async with client.session.get(server.make_url("/pin/123456/")) as response:
+            assert await response.text() == "ok"
+
+    assert len(client.session.connector._conns) == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_follow_redirects(server):
+    assert await follow_redirects(str(server.make_url("/abc"))) == str(
+        server.make_url("/pin/123456/")
+    )
@@ -0,0 +1,195 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+import handlers.inline as inline
+from services.file_cache import CachedFile, file_cache
+from services.links import MediaLink, parse
+from services.quotas import UserQuotaMiddleware
+
+
+def make_query(text):
+    query = Mock()
+    query.id = "1"
+    query.query = text
+    query.from_user.id = 7
+    query.answer = AsyncMock()
+    return query
+
+
+@pytest.fixture(autouse=True)
+def no_debounce():
+    with patch("handlers.inline.config.INLINE_DEBOUNCE", 0), patch(
+        "handlers.inline.latest_queries", {}
+    ):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_cached_youtube_formats_are_returned_by_file_id():
+    await file_cache.set("youtube:inl1:720p", [CachedFile("video", "video-id")])
+    await file_cache.set("youtube:inl1:mp3", [CachedFile("audio", "audio-id")])
+    query = make_query("https://youtu.be/inl1?si=x")
+
+    await inline.inline_dispatcher(query, AsyncMock())
+
+    results = query.answer.call_args.args[0]
+    assert [type(result).__name__ for result in results] == [
+        "InlineQueryResultCachedVideo",
+        "InlineQueryResultCachedAudio",
+    ]
+    assert results[0].video_file_id == "video-id"
+    assert results[1].audio_file_id == "audio-id"
+    assert query.answer.call_args.kwargs["is_personal"] is False
+
+
+@pytest.mark.asyncio
+async def test_instagram_carousel_returns_every_item():
+    await file_cache.set(
+        "instagram:Cinl:media",
+        [CachedFile("photo", "photo-id"), CachedFile("video", "video-id")],
+    )
+    query = make_query("https://www.instagram.com/p/Cinl/")
+
+    await inline.inline_dispatcher(query, AsyncMock())
+
+    results = query.answer.call_args.args[0]
+    assert results[0].photo_file_id == "photo-id"
+    assert results[1].video_file_id == "video-id"
+    assert len({result.id for result in results}) == 2
+
+
+@pytest.mark.asyncio
+async def test_cold_link_offers_chat_download_and_prefetches():
+    query = make_query("https://www.tiktok.com/@user/video/900")
+    bot = AsyncMock()
+
+    with patch("handlers.inline.config.CACHE_CHAT_ID", "-100"), patch(
+        "handlers.inline.upload_tiktok", AsyncMock(return_value=[])
+    ) as upload:
+        await inline.inline_dispatcher(query, bot)
+        await asyncio.gather(*inline.prefetches)
+
+    result = query.answer.call_args.args[0][0]
+    assert result.input_message_content.message_text == (
+        "https://www.tiktok.com/@user/video/900"
+    )
+    chat, url, key, job = upload.call_args.args
+    assert job.user_id == 7
+    assert isinstance(chat, inline.CacheChat)
+    assert chat.chat_id == "-100"
+    assert (url, key) == ("https://www.tiktok.com/@user/video/900", "tiktok:900:mp4")
+
+
+@pytest.mark.asyncio
+async def test_prefetch_is_skipped_when_user_is_over_quota():
+    quotas = UserQuotaMiddleware(max_jobs=2, per_minute=1, queue_size=1)
+    query = make_query("https://www.tiktok.com/@user/video/901")
+
+    with patch("handlers.inline.config.CACHE_CHAT_ID", "-100"), patch(
+        "handlers.inline.quota_middleware", quotas
+    ), patch("handlers.inline.upload_tiktok", AsyncMock(return_value=[])) as upload:
+        with quotas.try_acquire(7):
+            pass
+        await inline.inline_dispatcher(query, AsyncMock())
+        await asyncio.gather(*inline.prefetches)
+
+    query.answer.assert_called_once()
+    upload.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cold_link_without_cache_chat_does_not_prefetch():
+    query = make_query("https://soundcloud.com/artist/cold-track")
+
+    with patch("handlers.inline.config.CACHE_CHAT_ID", ""), patch(
+        "handlers.inline.upload_sc_track", AsyncMock()
+    ) as upload:
+        await inline.inline_dispatcher(query, AsyncMock())
+
+    query.answer.assert_called_once()
+    upload.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_superseded_keystrokes_skip_cache_lookups():
+    first = make_query("https://www.tiktok.com/@user/video/90")
+    second = make_query("https://www.tiktok.com/@user/video/901")
+    second.id = "2"
+
+    with patch(
+        "handlers.inline.file_cache.get", AsyncMock(return_value=[])
+    ) as get, patch("handlers.inline.config.CACHE_CHAT_ID", ""):
+        await asyncio.gather(
+            inline.inline_dispatcher(first, AsyncMock()),
+            inline.inline_dispatcher(second, AsyncMock()),
+        )
+
+    get.assert_called_once_with("tiktok:901:mp4")
+    first.answer.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unsupported_resolved_link_clears_pending_query():
+    query = make_query("https://vm.tiktok.com/ZMprofile/")
+    profile = MediaLink("tiktok", "user", "profile", "https://www.tiktok.com/@user")
+
+    with patch("handlers.inline.resolve", AsyncMock(return_value=profile)):
+        await inline.inline_dispatcher(query, AsyncMock())
+
+    query.answer.assert_not_called()
+    assert inline.latest_queries == {}
+
+
+@pytest.mark.asyncio
+async def test_other_queries_are_ignored():
+    query = make_query("котики")
+
+    await inline.inline_dispatcher(query, AsyncMock())
+
+    query.answer.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cache_chat_sends_to_configured_chat():
+    bot = AsyncMock()
+
+    await inline.CacheChat(bot, "-100").answer_audio("file", caption="c")
+
+    bot.send_audio.assert_called_once_with("-100", "file", caption="c")
+
+
+def test_prefetch_picks_youtube_format_up_to_720p():
+    with patch("handlers.inline.config.YT_HEIGHTS", (360, 480, 1080)):
+        key, upload, args = inline.prefetch_upload(parse("https://youtu.be/pre1"))
+
+    assert key == "youtube:pre1:480p"
+    assert args[1] == "480p"
+
+
+@pytest.mark.asyncio
+async def test_prefetch_sends_instagram_carousel_as_media_group(tmp_path):
+    query = make_query("https://www.instagram.com/p/Cpre/")
+    bot = AsyncMock()
+    video = Mock(video=Mock(file_id="video-id"), photo=None)
+    photo = Mock(video=None, audio=None, document=None, animation=None)
+    photo.photo = [Mock(file_id="photo-id")]
+    bot.send_media_group.return_value = [video, photo]
+    filepaths = [str(tmp_path / "a.mp4"), str(tmp_path / "b.jpg")]
+
+    with patch("handlers.inline.config.CACHE_CHAT_ID", "-100"), patch(
+        "handlers.instagram.fetch_instagram", AsyncMock(return_value=filepaths)
+    ), patch("handlers.instagram.ensure_uploadable", side_effect=lambda path: path), patch(
+        "handlers.instagram.input_file", side_effect=lambda path: path
+    ):
+        await inline.inline_dispatcher(query, bot)
+        await asyncio.gather(*inline.prefetches)
+
+    chat_id, group = bot.send_media_group.call_args.args
+    assert chat_id == "-100"
+    assert [item.type for item in group] == ["video", "photo"]
+    assert await file_cache.get("instagram:Cpre:media") == [
+        CachedFile("video", "video-id"),
+        CachedFile("photo", "photo-id"),
+    ]
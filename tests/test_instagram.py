@@ -1,51 +1,91 @@
-from unittest.mock import MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 from handlers import instagram
+from services.scheduler import Job
 
 
-@pytest.mark.asyncio
-async def test_download_instagram_single_video(tmp_path):
-    url = "https://www.instagram.com/reel/abc123/"
+def test_extract_instagram_has_no_fixed_sleep():
+    with patch("yt_dlp.YoutubeDL") as mock_ytdlp:
+        mock_instance = MagicMock()
+        mock_instance.extract_info.return_value = {"id": "abc123"}
+        mock_instance.sanitize_info.side_effect = lambda info: info
+        mock_ytdlp.return_value.__enter__.return_value = mock_instance
+
+        info = instagram.extract_instagram("https://www.instagram.com/reel/abc123/")
 
-    fake_info = {"id": "abc123", "ext": "mp4"}
+    options = mock_ytdlp.call_args.args[0]
+    assert info == {"id": "abc123"}
+    assert "sleep_interval" not in options
+    assert "max_sleep_interval" not in options
+    mock_instance.extract_info.assert_called_once_with(
+        "https://www.instagram.com/reel/abc123/", download=False
+    )
+
+
+def test_download_instagram_entry(tmp_path):
+    entry = {"id": "vid1", "ext": "mp4"}
 
     with patch("yt_dlp.YoutubeDL") as mock_ytdlp:
         mock_instance = MagicMock()
-        mock_instance.extract_info.return_value = fake_info
-        mock_instance.prepare_filename.return_value = str(
-            tmp_path / "abc123.mp4"
-        )
+        mock_instance.process_ie_result.return_value = entry
+        mock_instance.prepare_filename.return_value = str(tmp_path / "vid1.mp4")
         mock_ytdlp.return_value.__enter__.return_value = mock_instance
 
-        result = instagram.download_instagram(url, str(tmp_path))
+        result = instagram.download_instagram_entry(entry, str(tmp_path))
 
-    assert len(result) == 1
-    assert result[0].endswith(".mp4")
+    assert result == str(tmp_path / "vid1.mp4")
+    assert mock_ytdlp.call_args.args[0]["outtmpl"].startswith(str(tmp_path))
+    mock_instance.process_ie_result.assert_called_once_with(entry, download=True)
 
 
 @pytest.mark.asyncio
-async def test_download_instagram_playlist(tmp_path):
-    url = "https://www.instagram.com/reel/playlist123/"
+async def test_fetch_instagram_downloads_entries_concurrently(tmp_path):
+    entries = [{"id": f"vid{i}", "ext": "mp4"} for i in range(3)]
+    running = 0
+    peak = 0
 
-    fake_info = {
-        "entries": [
-            {"id": "vid1", "ext": "mp4"},
-            {"id": "vid2", "ext": "mp4"},
-        ]
-    }
+    async def fake_run(platform, job, func, *args):
+        nonlocal running, peak
+        if func is instagram.extract_instagram:
+            return {"entries": entries}
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"{args[1]}/{args[0]['id']}.mp4"
 
-    with patch("yt_dlp.YoutubeDL") as mock_ytdlp:
-        mock_instance = MagicMock()
-        mock_instance.extract_info.return_value = fake_info
-        mock_instance.prepare_filename.side_effect = [
-            str(tmp_path / "vid1.mp4"),
-            str(tmp_path / "vid2.mp4"),
-        ]
-        mock_ytdlp.return_value.__enter__.return_value = mock_instance
+    with patch("handlers.instagram.scheduler.run", side_effect=fake_run):
+        result = await instagram.fetch_instagram(
+            "https://www.instagram.com/p/abc/", str(tmp_path), Job(1)
+        )
+
+    assert result == [f"{tmp_path}/vid{i}.mp4" for i in range(3)]
+    assert peak == 3
 
-        result = instagram.download_instagram(url, str(tmp_path))
 
-    assert len(result) == 2
-    assert all(path.endswith(".mp4") for path in result)
+@pytest.mark.asyncio
+async def test_upload_instagram_sends_single_media_group(tmp_path):
+    message = AsyncMock()
+    message.answer_media_group.return_value = [MagicMock(), MagicMock()]
+    filepaths = [str(tmp_path / "a.mp4"), str(tmp_path / "b.jpg")]
+
+    with patch(
+        "handlers.instagram.fetch_instagram", AsyncMock(return_value=filepaths)
+    ), patch("handlers.instagram.ensure_uploadable", side_effect=lambda path: path), patch(
+        "handlers.instagram.input_file", side_effect=lambda path: path
+    ), patch("handlers.instagram.janitor.workdir") as mock_workdir:
+        mock_workdir.return_value.__enter__.return_value = tmp_path
+        await instagram.upload_instagram(
+            message, "https://www.instagram.com/p/abc/", "instagram:abc:media", Job()
+        )
+
+    message.answer_media_group.assert_called_once()
+    group = message.answer_media_group.call_args.args[0]
+    assert [item.type for item in group] == ["video", "photo"]
+    assert group[0].caption == "Скачано в @SaveTTasrobot"
+    assert group[1].caption is None
+    message.answer_video.assert_not_called()
+    message.answer_photo.assert_not_called()
@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+from services.janitor import Janitor
+from services.scheduler import Job
+
+
+def make_file(path, size, age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_sweep_reaps_expired_entries(tmp_path):
+    janitor = Janitor(tmp_path, ttl=60, quota=0, interval=1)
+    old = make_file(tmp_path / "tiktok_downloads" / "old.mp4", 100, age=120)
+    fresh = make_file(tmp_path / "tiktok_downloads" / "fresh.mp4", 50)
+    state = make_file(tmp_path / "file_cache.sqlite3", 10, age=120)
+
+    assert janitor.sweep() == 100
+    assert not old.exists()
+    assert fresh.exists()
+    assert state.exists()
+    assert janitor.reclaimed == 100
+
+
+def test_sweep_evicts_oldest_over_quota(tmp_path):
+    janitor = Janitor(tmp_path, ttl=3600, quota=150, interval=1)
+    oldest = make_file(tmp_path / "a" / "1.mp4", 100, age=30)
+    older = make_file(tmp_path / "b" / "2.mp4", 100, age=20)
+    newest = make_file(tmp_path / "a" / "3.mp4", 100, age=10)
+
+    assert janitor.sweep() == 200
+    assert not oldest.exists()
+    assert not older.exists()
+    assert newest.exists()
+
+
+def test_sweep_skips_active_workdirs(tmp_path):
+    janitor = Janitor(tmp_path, ttl=0, quota=1, interval=1)
+    job = Job()
+
+    with janitor.workdir(tmp_path / "youtube_downloads", job) as workdir:
+        active = make_file(workdir / "video.mp4", 100, age=120)
+        stale = make_file(tmp_path / "youtube_downloads" / "stale.mp4", 10, age=120)
+
+        assert janitor.sweep() == 10
+        assert active.exists()
+        assert not stale.exists()
+
+    assert not workdir.exists()
+
+
+def test_workdir_removed_on_error(tmp_path):
+    janitor = Janitor(tmp_path, ttl=60, quota=0, interval=1)
+
+    with pytest.raises(RuntimeError):
+        with janitor.workdir(tmp_path / "tiktok_downloads", Job()) as workdir:
+            make_file(workdir / "partial.mp4.part", 10)
+            raise RuntimeError()
+
+    assert not workdir.exists()
+    assert not janitor.active
+
+
+def test_sweep_counts_directory_usage(tmp_path):
+    janitor = Janitor(tmp_path, ttl=60, quota=0, interval=1)
+    make_file(tmp_path / "soundcloud_downloads" / "album_x" / "01.mp3", 30, age=120)
+    make_file(tmp_path / "soundcloud_downloads" / "album_x" / "02.mp3", 40, age=120)
+    album = tmp_path / "soundcloud_downloads" / "album_x"
+    stamp = time.time() - 120
+    os.utime(album, (stamp, stamp))
+
+    assert janitor.sweep() == 70
+    assert not album.exists()
@@ -0,0 +1,108 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services.links import IsLink, LinkMiddleware, MediaLink, parse, resolve
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (
+            "https://youtu.be/dQw4w9WgXcQ?si=abc",
+            ("youtube", "dQw4w9WgXcQ", "video", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+        ),
+        (
+            "смотри m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+            ("youtube", "dQw4w9WgXcQ", "video", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+        ),
+        (
+            "https://www.youtube.com/shorts/abc123?feature=share",
+            ("youtube", "abc123", "shorts", "https://www.youtube.com/watch?v=abc123"),
+        ),
+        (
+            "https://www.tiktok.com/@user/video/7301?is_from_webapp=1",
+            ("tiktok", "7301", "video", "https://www.tiktok.com/@user/video/7301"),
+        ),
+        (
+            "https://vm.tiktok.com/ZMabc/",
+            ("tiktok", "vm.tiktok.com/ZMabc", "short", "https://vm.tiktok.com/ZMabc"),
+        ),
+        (
+            "https://www.instagram.com/reels/Cabc/?igsh=xyz",
+            ("instagram", "Cabc", "reel", "https://www.instagram.com/reel/Cabc/"),
+        ),
+        (
+            "https://instagram.com/someone/p/Cabc/?img_index=1",
+            ("instagram", "Cabc", "post", "https://www.instagram.com/p/Cabc/"),
+        ),
+        (
+            "https://ru.pinterest.com/pin/123456/?utm_source=x",
+            ("pinterest", "123456", "pin", "https://www.pinterest.com/pin/123456/"),
+        ),
+        (
+            "https://pin.it/abc",
+            ("pinterest", "pin.it/abc", "short", "https://pin.it/abc"),
+        ),
+        (
+            "https://soundcloud.com/artist/track?si=abc&utm_source=clipboard",
+            ("soundcloud", "artist/track", "track", "https://soundcloud.com/artist/track"),
+        ),
+        (
+            "see file.mp4 https://youtu.be/abc",
+            ("youtube", "abc", "video", "https://www.youtube.com/watch?v=abc"),
+        ),
+        (
+            "https://example.com/x https://vm.tiktok.com/ZMabc/",
+            ("tiktok", "vm.tiktok.com/ZMabc", "short", "https://vm.tiktok.com/ZMabc"),
+        ),
+        (
+            "https://m.soundcloud.com/artist/sets/album",
+            ("soundcloud", "artist/sets/album", "album", "https://soundcloud.com/artist/sets/album"),
+        ),
+    ],
+)
+def test_parse(text, expected):
+    assert parse(text) == MediaLink(*expected)
+
+
+@pytest.mark.parametrize("text", ["", "привет", "https://example.com/video.mp4"])
+def test_parse_ignores_unknown_text(text):
+    assert parse(text) is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_caches_redirects():
+    link = parse("https://vt.tiktok.com/ZScached/")
+
+    with patch(
+        "services.links.follow_redirects",
+        return_value="https://www.tiktok.com/@user/video/42?_r=1",
+    ) as follow:
+        first = await resolve(link)
+        second = await resolve(link)
+
+    assert first == second == parse("https://www.tiktok.com/@user/video/42")
+    follow.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_resolve_keeps_short_link_on_failure():
+    link = parse("https://vt.tiktok.com/ZSbroken/")
+
+    with patch("services.links.follow_redirects", side_effect=OSError("offline")):
+        assert await resolve(link) == link
+
+
+@pytest.mark.asyncio
+async def test_middleware_parses_once_for_filters():
+    message = AsyncMock()
+    message.text = "https://youtu.be/dQw4w9WgXcQ"
+    handler = AsyncMock()
+
+    await LinkMiddleware()(handler, message, {})
+
+    data = handler.call_args.args[1]
+    assert await IsLink("youtube")(message, **data)
+    assert not await IsLink("tiktok")(message, **data)
+    assert not await IsLink("youtube", "shorts")(message, **data)
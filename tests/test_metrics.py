@@ -0,0 +1,114 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from services import metrics
+from services.file_cache import FileIdCache
+from services.metrics import (Counter, Gauge, Histogram, MetricsServer,
+                              Registry, timed)
+from services.scheduler import DownloadScheduler, Job
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    counter = registry.register(Counter("jobs_total", "Jobs", ("platform",)))
+    gauge = registry.register(Gauge("queue", "Queue", ("pool",)))
+
+    counter.inc(platform="tiktok")
+    counter.inc(2, platform="tiktok")
+    gauge.set(3, pool="youtube")
+
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{platform="tiktok"} 3' in text
+    assert 'queue{pool="youtube"} 3' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage", "Stage", ("stage",), buckets=(1, 5))
+
+    histogram.observe(0.5, stage="download")
+    histogram.observe(3, stage="download")
+    histogram.observe(10, stage="download")
+
+    lines = histogram.render()
+    assert 'stage_bucket{stage="download",le="1"} 1' in lines
+    assert 'stage_bucket{stage="download",le="5"} 2' in lines
+    assert 'stage_bucket{stage="download",le="+Inf"} 3' in lines
+    assert 'stage_sum{stage="download"} 13.5' in lines
+    assert 'stage_count{stage="download"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("errors", "Errors", ("error",))
+    counter.inc(error='say "hi"\n')
+
+    assert 'errors{error="say \\"hi\\"\\n"} 1' in counter.render()
+
+
+@pytest.mark.asyncio
+async def test_timed_records_duration_and_error_class():
+    with pytest.raises(ValueError):
+        async with timed("extract", "metrics-test"):
+            raise ValueError()
+
+    text = metrics.registry.render()
+    assert (
+        'downloader_stage_seconds_count{stage="extract",platform="metrics-test"} 1'
+        in text
+    )
+    assert (
+        'downloader_errors_total{stage="extract",platform="metrics-test",'
+        'error="ValueError"} 1' in text
+    )
+
+
+@pytest.mark.asyncio
+async def test_file_cache_counts_hits_and_misses():
+    cache = FileIdCache(":memory:", ttl=60, max_entries=10)
+    await cache.get("metricsplatform:a:mp4")
+    await cache.set("metricsplatform:a:mp4", [("video", "ID")])
+    await cache.get("metricsplatform:a:mp4")
+
+    text = metrics.registry.render()
+    assert 'platform="metricsplatform",result="hit"} 1' in text
+    assert 'platform="metricsplatform",result="miss"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reports_queue_depth_and_in_flight():
+    scheduler = DownloadScheduler({"metrics_pool": 1}, max_queue=5)
+    pool = scheduler.pools["metrics_pool"]
+    await pool.acquire(Job(1))
+    waiter = asyncio.create_task(pool.acquire(Job(2)))
+    await asyncio.sleep(0)
+
+    text = metrics.registry.render()
+    assert 'downloader_jobs_in_flight{pool="metrics_pool"} 1' in text
+    assert 'downloader_queue_depth{pool="metrics_pool"} 1' in text
+
+    pool.release()
+    await waiter
+    pool.release()
+    text = metrics.registry.render()
+    assert 'downloader_jobs_in_flight{pool="metrics_pool"} 0' in text
+    assert 'downloader_queue_depth{pool="metrics_pool"} 0' in text
+    scheduler.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_registry(unused_tcp_port):
+    server = MetricsServer("127.0.0.1", unused_tcp_port)
+    await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{unused_tcp_port}/metrics"
+            ) as response:
+                body = await response.text()
+    finally:
+        await server.stop()
+
+    assert response.status == 200
+    assert "# TYPE downloader_stage_seconds histogram" in body
@@ -1,8 +1,44 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
 from pathlib import Path
 
-from handlers.pinterest import router, extract_video_url, send_pinterest_video
+from handlers.pinterest import (router, extract_video_url, find_video_url,
+                                send_pinterest_video)
+from services.state_store import CallbackStore, MemoryBackend
+
+
+@pytest.fixture(autouse=True)
+def inline_state():
+    store = CallbackStore(MemoryBackend(100), "pin_inline", 60)
+    with patch("handlers.pinterest.inline_urls", store), patch(
+        "handlers.pinterest.config.INLINE_DEBOUNCE", 0
+    ), patch("handlers.inline.latest_queries", {}):
+        yield store
+
+
+def mock_http(response):
+    client = MagicMock()
+    client.session.get.return_value.__aenter__.return_value = response
+    return patch("handlers.pinterest.http_client", client)
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "pinterest"
+
+
+def page_response(status, text, chunk_size=64 * 1024, read=None):
+    async def chunks(size):
+        data = text.encode()
+        for start in range(0, len(data), chunk_size):
+            if read is not None:
+                read.append(start)
+            yield data[start:start + chunk_size]
+
+    response = Mock()
+    response.status = status
+    response.charset = "utf-8"
+    response.content.iter_chunked = chunks
+    return response
 
 
 class TestPinterestBot:
@@ -42,7 +78,8 @@ class TestPinterestBot:
         with patch("handlers.pinterest.yt_dlp.YoutubeDL") as mock_ydl:
             mock_instance = Mock()
             mock_instance.extract_info.return_value = {"url": expected_video_url}
-            mock_ydl.return_value = mock_instance
+            mock_instance.sanitize_info.side_effect = lambda info: info
+            mock_ydl.return_value.__enter__.return_value = mock_instance
 
             result = await extract_video_url(test_url)
 
@@ -59,7 +96,8 @@ class TestPinterestBot:
             mock_instance.extract_info.return_value = {
                 "entries": [{"url": expected_video_url}]
             }
-            mock_ydl.return_value = mock_instance
+            mock_instance.sanitize_info.side_effect = lambda info: info
+            mock_ydl.return_value.__enter__.return_value = mock_instance
 
             result = await extract_video_url(test_url)
 
@@ -74,18 +112,14 @@ class TestPinterestBot:
         with patch("handlers.pinterest.yt_dlp.YoutubeDL") as mock_ydl:
             mock_instance = Mock()
             mock_instance.extract_info.side_effect = Exception("yt-dlp error")
-            mock_ydl.return_value = mock_instance
-
-            with patch("handlers.pinterest.requests.get") as mock_get:
-                mock_response = Mock()
-                mock_response.status_code = 200
-                mock_response.text = html_content
-                mock_get.return_value = mock_response
+            mock_instance.sanitize_info.side_effect = lambda info: info
+            mock_ydl.return_value.__enter__.return_value = mock_instance
 
+            with mock_http(page_response(200, html_content)) as mock_client:
                 result = await extract_video_url(test_url)
 
                 assert result == expected_video_url
-                mock_get.assert_called_once()
+                mock_client.session.get.assert_called_once_with(test_url)
 
     @pytest.mark.asyncio
     async def test_extract_video_url_not_found(self):
@@ -94,13 +128,10 @@ class TestPinterestBot:
         with patch("handlers.pinterest.yt_dlp.YoutubeDL") as mock_ydl:
             mock_instance = Mock()
             mock_instance.extract_info.side_effect = Exception("yt-dlp error")
-            mock_ydl.return_value = mock_instance
+            mock_instance.sanitize_info.side_effect = lambda info: info
+            mock_ydl.return_value.__enter__.return_value = mock_instance
 
-            with patch("handlers.pinterest.requests.get") as mock_get:
-                mock_response = Mock()
-                mock_response.status_code = 200
-                mock_response.text = "<html>No video here</html>"
-                mock_get.return_value = mock_response
+            with mock_http(page_response(200, "<html>No video here</html>")):
 
                 with pytest.raises(Exception, match="Видео URL не найден"):
                     await extract_video_url(test_url)
@@ -119,9 +150,14 @@ class TestPinterestBot:
             assert "Cкачано в @SaveTTasrobot" in call_args.kwargs["caption"]
 
     @pytest.mark.asyncio
-    async def test_send_pinterest_video_download_fallback(self, mock_message):
+    async def test_send_pinterest_video_download_fallback(self, mock_message, tmp_path):
         test_url = "https://www.pinterest.com/pin/123456/"
         video_url = "https://example.com/video.mp4"
+        spilled = []
+
+        def read_spill(path):
+            spilled.append((path, Path(path).read_bytes()))
+            return path
 
         with patch("handlers.pinterest.extract_video_url", return_value=video_url):
             mock_message.answer_video.side_effect = [
@@ -129,39 +165,68 @@ class TestPinterestBot:
                 AsyncMock(),
             ]
 
-            with patch("handlers.pinterest.requests.get") as mock_requests_get:
-                mock_response = Mock()
-                mock_response.status_code = 200
-                mock_response.iter_content.return_value = [b"fake_video_data"]
-                mock_requests_get.return_value = mock_response
+            async def chunks(size):
+                yield b"fake_video_data"
+
+            mock_response = Mock()
+            mock_response.status = 200
+            mock_response.content_length = None
+            mock_response.content.iter_chunked = chunks
+
+            with mock_http(mock_response), patch(
+                "handlers.pinterest.DOWNLOAD_DIR", str(tmp_path)
+            ), patch("handlers.pinterest.input_file", side_effect=read_spill):
+                await send_pinterest_video(mock_message, test_url)
 
-                import tempfile
-                import os
+        [(path, data)] = spilled
+        assert data == b"fake_video_data"
+        assert Path(path).parent.parent == tmp_path
+        assert Path(path).parent.name.startswith("job_")
+        assert not any(tmp_path.iterdir())
 
-                with tempfile.NamedTemporaryFile(
-                    delete=False, suffix=".mp4"
-                ) as temp_file:
-                    temp_file.write(b"fake_video_data")
-                    temp_path = temp_file.name
+    @pytest.mark.asyncio
+    async def test_send_pinterest_video_streams_small_files(self, mock_message):
+        test_url = "https://www.pinterest.com/pin/123456/"
+        video_url = "https://example.com/video.mp4"
+        uploaded = []
 
-                try:
-                    with patch("handlers.pinterest.Path") as mock_path:
-                        mock_path.return_value.mkdir.return_value = None
-                        mock_path.return_value.__truediv__.return_value = Path(
-                            temp_path
-                        )
+        async def upload(video, caption):
+            if isinstance(video, str):
+                raise Exception("Direct upload failed")
+            async for chunk in video.read(None):
+                uploaded.append(chunk)
 
-                        with patch("handlers.pinterest.FSInputFile") as mock_fs_input:
-                            mock_fs_input.return_value = temp_path
+        async def chunks(size):
+            yield b"fake_"
+            yield b"video"
 
-                            await send_pinterest_video(mock_message, test_url)
+        mock_response = Mock()
+        mock_response.status = 200
+        mock_response.content_length = 10
+        mock_response.content.iter_chunked = chunks
+        mock_message.answer_video.side_effect = upload
 
-                            mock_fs_input.assert_called_once()
+        with patch("handlers.pinterest.extract_video_url", return_value=video_url):
+            with mock_http(mock_response), patch("handlers.pinterest.open") as mock_open:
+                await send_pinterest_video(mock_message, test_url)
 
-                finally:
-                    # Очистка
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
+        assert b"".join(uploaded) == b"fake_video"
+        mock_open.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_send_pinterest_video_rejects_oversized(self, mock_message):
+        mock_response = Mock()
+        mock_response.status = 200
+        mock_response.content_length = 10 * 1024 ** 3
+        mock_message.answer_video.side_effect = Exception("Direct upload failed")
+
+        with patch(
+            "handlers.pinterest.extract_video_url",
+            return_value="https://example.com/video.mp4",
+        ), mock_http(mock_response):
+            await send_pinterest_video(mock_message, "https://www.pinterest.com/pin/1/")
+
+        assert "больше лимита" in mock_message.answer.call_args.args[0]
 
     @pytest.mark.asyncio
     async def test_send_pinterest_video_error_handling(self, mock_message):
@@ -230,17 +295,17 @@ class TestPinterestBot:
         pin_it_handler = self.get_handler_by_callback_name("handle_pinit_link")
         assert pin_it_handler is not None, "Pin.it handler not found"
 
-        with patch("handlers.pinterest.requests.head") as mock_head:
-            mock_response = Mock()
-            mock_response.url = "https://www.pinterest.com/pin/123456/"
-            mock_head.return_value = mock_response
+        with patch("services.links.follow_redirects") as mock_follow:
+            mock_follow.return_value = "https://www.pinterest.com/pin/123456/sent/?invite_code=x"
 
             with patch(
                 "handlers.pinterest.send_pinterest_video", AsyncMock()
             ) as mock_send:
                 await pin_it_handler(message)
 
-                mock_send.assert_called_once()
+                mock_send.assert_called_once_with(
+                    message, "https://www.pinterest.com/pin/123456/"
+                )
 
     @pytest.mark.asyncio
     async def test_handle_pinterest_link_handler_success(self):
@@ -274,6 +339,50 @@ class TestPinterestBot:
         for expected in expected_handlers:
             assert expected in handler_names, f"Handler {expected} not found"
 
+    @pytest.mark.asyncio
+    async def test_pinterest_inline_repeat_uses_cache(self, mock_inline_query):
+        inline_handler = self.get_handler_by_callback_name("pinterest_inline")
+
+        with patch(
+            "handlers.pinterest.extract_video_url",
+            return_value="https://example.com/video.mp4",
+        ) as mock_extract:
+            await inline_handler(mock_inline_query)
+            mock_inline_query.query = "https://ru.pinterest.com/pin/123456/?utm=x"
+            await inline_handler(mock_inline_query)
+
+        mock_extract.assert_called_once()
+        assert mock_inline_query.answer.call_count == 2
+        kwargs = mock_inline_query.answer.call_args.kwargs
+        assert kwargs["cache_time"] > 0
+        assert kwargs["is_personal"] is False
+
+    @pytest.mark.asyncio
+    async def test_pinterest_inline_drops_superseded_queries(self):
+        inline_handler = self.get_handler_by_callback_name("pinterest_inline")
+        queries = []
+        for query_id, text in enumerate(
+            ["https://www.pinterest.com/pin/12/", "https://www.pinterest.com/pin/123/"]
+        ):
+            query = Mock()
+            query.id = str(query_id)
+            query.query = text
+            query.from_user.id = 1
+            query.answer = AsyncMock()
+            queries.append(query)
+
+        with patch(
+            "handlers.pinterest.config.INLINE_DEBOUNCE", 0.05
+        ), patch(
+            "handlers.pinterest.extract_video_url",
+            return_value="https://example.com/video.mp4",
+        ) as mock_extract:
+            await asyncio.gather(*(inline_handler(query) for query in queries))
+
+        queries[0].answer.assert_not_called()
+        queries[1].answer.assert_called_once()
+        mock_extract.assert_called_once_with("https://www.pinterest.com/pin/123/")
+
     def test_direct_function_calls(self):
 
         assert callable(extract_video_url)
@@ -293,3 +402,41 @@ class TestPinterestBot:
             await send_pinterest_video(message, "https://www.pinterest.com/pin/123456/")
 
             message.answer_video.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "fixture, expected",
+    [
+        ("video_pin.html", "https://v1.pinimg.com/videos/mc/expMp4/7f/3a/9c/7f3a9c_t4.mp4"),
+        ("og_video.html", "https://v1.pinimg.com/videos/mc/720p/1d/2e/3f/1d2e3f.mp4"),
+        ("image_pin.html", None),
+    ],
+)
+def test_find_video_url_fixtures(fixture, expected):
+    assert find_video_url((FIXTURES / fixture).read_text()) == expected
+
+
+def test_find_video_url_prefers_best_variant():
+    html = (
+        '"video_list": {"V_EXP4": {"url": "https://v1.pinimg.com/a_t1.mp4", '
+        '"width": 240, "height": 426}, "V_720P": {"url": '
+        '"https:\\/\\/v1.pinimg.com\\/720p\\/a.mp4", "width": 720, "height": 1280}}'
+    )
+
+    assert find_video_url(html) == "https://v1.pinimg.com/720p/a.mp4"
+
+
+@pytest.mark.asyncio
+async def test_extract_video_url_stops_reading_after_video_list():
+    html = (FIXTURES / "video_pin.html").read_text()
+    read = []
+
+    with patch("handlers.pinterest.yt_dlp.YoutubeDL") as mock_ydl:
+        mock_ydl.return_value.__enter__.return_value.extract_info.side_effect = (
+            Exception("yt-dlp error")
+        )
+        with mock_http(page_response(200, html, chunk_size=1024, read=read)):
+            result = await extract_video_url("https://www.pinterest.com/pin/1/")
+
+    assert result.endswith("7f3a9c_t4.mp4")
+    assert len(read) < len(html.encode()) // 1024 // 2
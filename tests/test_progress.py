@@ -0,0 +1,93 @@
+import asyncio
+import pickle
+import threading
+from unittest.mock import AsyncMock
+
+import pytest
+
+from services.cancellation import CancelToken
+from services.progress import ProgressReporter, format_progress
+from services.scheduler import DownloadScheduler, Job
+
+
+def downloading(done, total=100 * 1024 * 1024, **extra):
+    return {
+        "status": "downloading",
+        "downloaded_bytes": done,
+        "total_bytes": total,
+        **extra,
+    }
+
+
+def test_format_progress():
+    status = downloading(25 * 1024 * 1024, speed=2 * 1024 * 1024, eta=75)
+
+    text = format_progress(status)
+
+    assert text == "⬇️ 25% из 100.0 МБ · 2.0 МБ/с · осталось 1:15"
+
+
+def test_format_progress_without_total():
+    assert format_progress({"downloaded_bytes": 1024 * 1024}) == "⬇️ 1.0 МБ"
+
+
+@pytest.mark.asyncio
+async def test_reporter_coalesces_updates_from_threads():
+    status = AsyncMock()
+    reporter = ProgressReporter(status, "Скачиваю...", interval=0.05)
+    reporter.bind()
+
+    def worker():
+        for percent in range(1, 101):
+            reporter.hook(downloading(percent * 1024 * 1024))
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    await asyncio.sleep(0.15)
+
+    assert 1 <= status.edit_text.call_count <= 3
+    last = status.edit_text.call_args.args[0]
+    assert last.startswith("Скачиваю...\n⬇️ 100%")
+
+
+@pytest.mark.asyncio
+async def test_reporter_ignores_non_download_events():
+    status = AsyncMock()
+    reporter = ProgressReporter(status, interval=0)
+    reporter.bind()
+
+    reporter.hook({"status": "finished"})
+    await asyncio.sleep(0.01)
+
+    status.edit_text.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reports_progress_for_jobs_with_status():
+    scheduler = DownloadScheduler({"youtube": 1}, max_queue=5)
+    edited = threading.Event()
+    status = AsyncMock(text="Скачиваю...")
+    status.edit_text.side_effect = lambda text: edited.set()
+    job = Job(1, status)
+    job.progress.interval = 0
+
+    def download(token):
+        token.hook(downloading(50 * 1024 * 1024))
+        return edited.wait(5)
+
+    assert await scheduler.run("youtube", job, download, job.token)
+    scheduler.shutdown()
+
+    status.edit_text.assert_called_once_with("Скачиваю...\n⬇️ 50% из 100.0 МБ")
+
+
+def test_token_pickles_without_progress_hook():
+    token = CancelToken()
+    token.progress = lambda status: None
+    token._event = None
+
+    restored = pickle.loads(pickle.dumps(token))
+
+    assert restored.progress is None
+    assert restored.marker == token.marker
@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.types import Message
+
+from services.quotas import UserQuotaMiddleware, format_eta
+
+
+def make_event(user_id=1):
+    event = MagicMock(spec=Message)
+    event.from_user = MagicMock(id=user_id)
+    event.answer = AsyncMock(return_value=AsyncMock())
+    return event
+
+
+def download_data():
+    return {"handler": MagicMock(flags={"download": True})}
+
+
+@pytest.mark.asyncio
+async def test_unflagged_handlers_pass_through():
+    middleware = UserQuotaMiddleware(max_jobs=0, per_minute=0, queue_size=0)
+    handler = AsyncMock(return_value="done")
+
+    result = await middleware(handler, make_event(), {"handler": MagicMock(flags={})})
+
+    assert result == "done"
+    assert middleware.users == {}
+
+
+@pytest.mark.asyncio
+async def test_excess_jobs_wait_in_queue_with_position():
+    middleware = UserQuotaMiddleware(max_jobs=1, per_minute=0, queue_size=5)
+    release = asyncio.Event()
+    order = []
+
+    async def handler(event, data):
+        order.append(event)
+        await release.wait()
+
+    first, second, third = make_event(), make_event(), make_event()
+    tasks = [
+        asyncio.create_task(middleware(handler, event, download_data()))
+        for event in (first, second, third)
+    ]
+    await asyncio.sleep(0.01)
+
+    assert order == [first]
+    second.answer.assert_called_once()
+    assert "очереди: 1" in second.answer.call_args.args[0]
+    assert "очереди: 2" in third.answer.call_args.args[0]
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == [first, second, third]
+    second.answer.return_value.delete.assert_called_once()
+    assert middleware.users == {}
+
+
+@pytest.mark.asyncio
+async def test_users_do_not_block_each_other():
+    middleware = UserQuotaMiddleware(max_jobs=1, per_minute=0, queue_size=5)
+    release = asyncio.Event()
+    started = []
+
+    async def handler(event, data):
+        started.append(event.from_user.id)
+        await release.wait()
+
+    tasks = [
+        asyncio.create_task(middleware(handler, make_event(user_id), download_data()))
+        for user_id in (1, 2)
+    ]
+    await asyncio.sleep(0.01)
+
+    assert sorted(started) == [1, 2]
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_per_minute_quota_delays_jobs():
+    middleware = UserQuotaMiddleware(max_jobs=5, per_minute=1, queue_size=5)
+    handler = AsyncMock()
+    await middleware(handler, make_event(), download_data())
+
+    waiting = make_event()
+    task = asyncio.create_task(middleware(handler, waiting, download_data()))
+    await asyncio.sleep(0.01)
+
+    assert handler.call_count == 1
+    assert "примерно через" in waiting.answer.call_args.args[0]
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not middleware.users[1].waiting
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_refused():
+    middleware = UserQuotaMiddleware(max_jobs=0, per_minute=0, queue_size=0)
+    handler = AsyncMock()
+    event = make_event()
+
+    await middleware(handler, event, download_data())
+
+    handler.assert_not_called()
+    assert "Слишком много" in event.answer.call_args.args[0]
+    assert middleware.users == {}
+
+
+def test_format_eta():
+    assert format_eta(0.2) == "1 с"
+    assert format_eta(45) == "45 с"
+    assert format_eta(61) == "2 мин"
+
+
+def test_try_acquire_respects_in_flight_limit():
+    quotas = UserQuotaMiddleware(max_jobs=1, per_minute=0, queue_size=1)
+
+    with quotas.try_acquire(7) as first:
+        with quotas.try_acquire(7) as second:
+            assert (first, second) == (True, False)
+
+    assert quotas.users == {}
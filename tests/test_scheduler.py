@@ -0,0 +1,159 @@
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.cancellation import JobCancelled
+from services.scheduler import DownloadScheduler, Job, QueueFullError
+
+
+def blocking(event: threading.Event, value):
+    event.wait(5)
+    return value
+
+
+def cancellable(token):
+    while True:
+        token.check()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def scheduler():
+    download_scheduler = DownloadScheduler({"tiktok": 1}, max_queue=3)
+    yield download_scheduler
+    download_scheduler.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_returns_result(scheduler):
+    assert await scheduler.run("tiktok", None, lambda: 42) == 42
+    assert scheduler.stats()["tiktok"] == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_queued_job_reports_position(scheduler):
+    gate = threading.Event()
+    first = asyncio.create_task(scheduler.run("tiktok", Job(1), blocking, gate, "a"))
+    await asyncio.sleep(0.05)
+
+    status = AsyncMock()
+    second = asyncio.create_task(
+        scheduler.run("tiktok", Job(2, status, "Скачиваю"), blocking, gate, "b")
+    )
+    await asyncio.sleep(0.05)
+
+    assert scheduler.stats()["tiktok"] == (1, 1)
+    assert "очереди: 1" in status.edit_text.call_args_list[0].args[0]
+
+    gate.set()
+    assert await asyncio.gather(first, second) == ["a", "b"]
+    status.edit_text.assert_called_with("Скачиваю")
+
+
+@pytest.mark.asyncio
+async def test_round_robin_between_users(scheduler):
+    gate = threading.Event()
+    order = []
+
+    def record(name):
+        order.append(name)
+
+    blocker = asyncio.create_task(scheduler.run("tiktok", Job(0), blocking, gate, None))
+    await asyncio.sleep(0.05)
+
+    tasks = [
+        asyncio.create_task(scheduler.run("tiktok", Job(1), record, "album-1")),
+        asyncio.create_task(scheduler.run("tiktok", Job(1), record, "album-2")),
+        asyncio.create_task(scheduler.run("tiktok", Job(2), record, "short")),
+    ]
+    await asyncio.sleep(0.05)
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+
+    assert order == ["album-1", "short", "album-2"]
+
+
+@pytest.mark.asyncio
+async def test_queue_full(scheduler):
+    gate = threading.Event()
+    tasks = [
+        asyncio.create_task(scheduler.run("tiktok", Job(i), blocking, gate, i))
+        for i in range(4)
+    ]
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(QueueFullError):
+        await scheduler.run("tiktok", Job(9), blocking, gate, 9)
+
+    gate.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_timeout_cancels_worker_and_frees_slot(scheduler):
+    job = Job(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await scheduler.run("tiktok", job, cancellable, job.token, timeout=0.05)
+
+    assert job.token.cancelled
+    assert scheduler.stats()["tiktok"] == (0, 0)
+    assert scheduler.jobs == {}
+
+
+@pytest.mark.asyncio
+async def test_cancel_user_stops_running_and_queued_jobs(scheduler):
+    running, queued = Job(7), Job(7)
+    tasks = [
+        asyncio.create_task(
+            scheduler.run("tiktok", running, cancellable, running.token)
+        ),
+        asyncio.create_task(scheduler.run("tiktok", queued, lambda: "never")),
+    ]
+    await asyncio.sleep(0.05)
+
+    assert scheduler.cancel_user(7) == 2
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert all(isinstance(result, JobCancelled) for result in results)
+    assert scheduler.stats()["tiktok"] == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_process_pool_platform_runs_in_worker_process():
+    download_scheduler = DownloadScheduler(
+        {"youtube": 1}, max_queue=1, process_platforms={"youtube"}
+    )
+    try:
+        worker_pid = await download_scheduler.run("youtube", Job(1), os.getpid)
+    finally:
+        download_scheduler.shutdown()
+
+    assert worker_pid != os.getpid()
+
+
+def test_unknown_process_pool_platforms_are_ignored(caplog):
+    download_scheduler = DownloadScheduler(
+        {"tiktok": 1}, max_queue=1, process_platforms={"tiktok_typo"}
+    )
+
+    assert not download_scheduler.pools["tiktok"].use_processes
+    assert "tiktok_typo" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fails_fast_when_platform_breaker_open():
+    from services.throttle import CircuitOpenError, guards
+
+    scheduler = DownloadScheduler({"tiktok": 1}, max_queue=5)
+    func = MagicMock()
+    guards["tiktok"].breaker.trip(time.monotonic())
+
+    with pytest.raises(CircuitOpenError):
+        await scheduler.run("tiktok", Job(1), func)
+
+    func.assert_not_called()
@@ -0,0 +1,96 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services.cancellation import JobCancelled
+from services.file_cache import CachedFile
+from services.singleflight import SingleFlight, deliver
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def download():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "file"
+
+    tasks = [asyncio.create_task(flights.run("tiktok:1:mp4", download)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert "tiktok:1:mp4" in flights
+    release.set()
+
+    results = await asyncio.gather(*tasks)
+
+    assert calls == 1
+    assert results == [("file", False), ("file", True), ("file", True)]
+    assert "tiktok:1:mp4" not in flights
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_with_waiters():
+    flights = SingleFlight()
+
+    async def download():
+        await asyncio.sleep(0.01)
+        raise ValueError("broken")
+
+    results = await asyncio.gather(
+        flights.run("key", download), flights.run("key", download),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_waiter_takes_over_cancelled_call():
+    flights = SingleFlight()
+    calls = 0
+
+    async def download():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        if calls == 1:
+            raise JobCancelled()
+        return "file"
+
+    leader = asyncio.create_task(flights.run("key", download))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flights.run("key", download))
+
+    with pytest.raises(JobCancelled):
+        await leader
+    assert await waiter == ("file", False)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_deliver_sends_file_ids_to_waiters():
+    files = [CachedFile("video", "file-id")]
+    release = asyncio.Event()
+
+    async def upload(message):
+        await release.wait()
+        await message.answer_video("uploaded")
+        return files
+
+    leader, waiter = AsyncMock(), AsyncMock()
+
+    with patch("services.singleflight.flights", SingleFlight()):
+        tasks = [
+            asyncio.create_task(deliver("key", "caption", upload, leader)),
+            asyncio.create_task(deliver("key", "caption", upload, waiter)),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+    leader.answer_video.assert_called_once_with("uploaded")
+    waiter.answer_video.assert_called_once_with("file-id", caption="caption")
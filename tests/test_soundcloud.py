@@ -1,19 +1,27 @@
+import asyncio
+
 import pytest
 from unittest.mock import Mock, patch, AsyncMock
 from pathlib import Path
 import tempfile
 import shutil
+import time
+import zipfile
 
+from services.cancellation import JobCancelled
+from services.scheduler import Job, scheduler
 from handlers.soundcloud import (
     get_url_hash,
     store_url,
     get_url,
     download_sc_track_simple,
     download_sc_album,
+    AlbumResult,
     url_storage,
     handle_sc,
     handle_album_callback,
     handle_track_callback,
+    telegram_audio,
 )
 
 
@@ -22,11 +30,15 @@ class TestSoundCloudFunctions:
         self.temp_dir = tempfile.mkdtemp()
         self.test_url = "https://soundcloud.com/user/test-track"
         self.test_album_url = "https://soundcloud.com/user/sets/test-album"
-        url_storage.clear()
+        self.sent = []
 
     def teardown_method(self):
         shutil.rmtree(self.temp_dir, ignore_errors=True)
 
+    async def read_volume(self, volume):
+        with zipfile.ZipFile(volume) as archive:
+            self.sent.append(archive.namelist())
+
     def test_url_hashing(self):
         hash1 = get_url_hash(self.test_url)
         hash2 = get_url_hash(self.test_url)
@@ -34,12 +46,14 @@ class TestSoundCloudFunctions:
         assert hash1 == hash2
         assert len(hash1) == 10
 
-    def test_url_storage(self):
-        hash_key = store_url(self.test_url)
+    @pytest.mark.asyncio
+    async def test_url_storage(self):
+        hash_key = await store_url(self.test_url)
 
-        assert hash_key in url_storage
-        assert url_storage[hash_key] == self.test_url
-        assert get_url(hash_key) == self.test_url
+        assert hash_key == get_url_hash(self.test_url)
+        assert await url_storage.get(hash_key) == self.test_url
+        assert await get_url(hash_key) == self.test_url
+        assert await get_url("missing") == ""
 
     @pytest.mark.asyncio
     async def test_download_sc_track_simple_success(self):
@@ -57,21 +71,92 @@ class TestSoundCloudFunctions:
 
     @pytest.mark.asyncio
     async def test_download_sc_album_success(self):
-        with patch("handlers.soundcloud.run_yt_dlp_with_timeout"):
-            with patch("handlers.soundcloud.Path.glob") as mock_glob:
-                mock_files = [Mock(spec=Path, is_file=lambda: True) for _ in range(2)]
-                mock_glob.return_value = mock_files
+        def fake_download(url, options, token=None):
+            Path(options["outtmpl"].replace("%(title)s.%(ext)s", "track.mp3")).write_bytes(b"mp3")
+
+        with patch("handlers.soundcloud.DOWNLOAD_DIR", Path(self.temp_dir)), patch(
+            "handlers.soundcloud.list_album_tracks", return_value=["t1", "t2"]
+        ), patch("handlers.soundcloud.run_yt_dlp", side_effect=fake_download):
+            result = await download_sc_album(self.test_album_url, on_volume=self.read_volume)
+
+        assert not result.partial
+        assert len(result.volumes) == 1
+        assert result.volumes[0].parent.name.startswith("album_")
+        assert sorted(self.sent[0]) == ["01. track.mp3", "02. track.mp3"]
+        assert not any(Path(self.temp_dir).iterdir())
+
+    @pytest.mark.asyncio
+    async def test_download_sc_album_reports_failed_volumes(self):
+        def fake_download(url, options, token=None):
+            Path(options["outtmpl"].replace("%(title)s.%(ext)s", "track.mp3")).write_bytes(b"mp3")
 
-                with patch("handlers.soundcloud.zipfile.ZipFile"):
-                    result = await download_sc_album(self.test_album_url)
-                    assert isinstance(result, Path)
+        async def on_volume(volume):
+            raise RuntimeError("Telegram недоступен")
+
+        with patch("handlers.soundcloud.DOWNLOAD_DIR", Path(self.temp_dir)), patch(
+            "handlers.soundcloud.list_album_tracks", return_value=["t1"]
+        ), patch("handlers.soundcloud.run_yt_dlp", side_effect=fake_download):
+            result = await download_sc_album(self.test_album_url, on_volume=on_volume)
+
+        assert result.partial
+        assert result.failed == 1
+
+    @pytest.mark.asyncio
+    async def test_cancel_user_stops_remaining_album_tracks(self):
+        started = []
+
+        def fake_download(url, options, token=None):
+            started.append(url)
+            while True:
+                token.check()
+                time.sleep(0.01)
+
+        with patch("handlers.soundcloud.DOWNLOAD_DIR", Path(self.temp_dir)), patch(
+            "handlers.soundcloud.list_album_tracks",
+            return_value=[f"t{index}" for index in range(9)],
+        ), patch("handlers.soundcloud.run_yt_dlp", side_effect=fake_download), patch(
+            "handlers.soundcloud.config.SC_ALBUM_PARALLELISM", 3
+        ):
+            album = asyncio.create_task(
+                download_sc_album(self.test_album_url, Job(42))
+            )
+            while len(started) < 3:
+                await asyncio.sleep(0.01)
+
+            assert scheduler.cancel_user(42) == 1
+            with pytest.raises(JobCancelled):
+                await album
+
+        assert len(started) == 3
+        assert 42 not in scheduler.jobs
 
     @pytest.mark.asyncio
     async def test_download_sc_album_no_files(self):
-        with patch("handlers.soundcloud.run_yt_dlp_with_timeout"):
-            with patch("handlers.soundcloud.Path.glob", return_value=[]):
-                with pytest.raises(Exception, match="Не удалось скачать файлы альбома"):
-                    await download_sc_album(self.test_album_url)
+        with patch("handlers.soundcloud.DOWNLOAD_DIR", Path(self.temp_dir)), patch(
+            "handlers.soundcloud.list_album_tracks", return_value=[]
+        ):
+            with pytest.raises(Exception, match="Не удалось скачать файлы альбома"):
+                await download_sc_album(self.test_album_url)
+
+    @pytest.mark.asyncio
+    async def test_download_sc_album_keeps_finished_tracks_on_timeout(self):
+        def fake_download(url, options, token=None):
+            if url == "slow":
+                while True:
+                    token.check()
+                    time.sleep(0.01)
+            Path(options["outtmpl"].replace("%(title)s.%(ext)s", "fast.mp3")).write_bytes(b"mp3")
+
+        with patch("handlers.soundcloud.DOWNLOAD_DIR", Path(self.temp_dir)), patch(
+            "handlers.soundcloud.list_album_tracks", return_value=["fast", "slow"]
+        ), patch("handlers.soundcloud.run_yt_dlp", side_effect=fake_download), patch(
+            "handlers.soundcloud.config.SC_ALBUM_TIMEOUT", 0.3
+        ):
+            result = await download_sc_album(self.test_album_url, on_volume=self.read_volume)
+
+        assert result.partial
+        assert self.sent == [["01. fast.mp3"]]
+        assert not any(Path(self.temp_dir).glob("album_*/*"))
 
 
 class TestRouterHandlers:
@@ -97,7 +182,7 @@ class TestRouterHandlers:
         self.message.text = "https://soundcloud.com/user/track"
 
         with patch("handlers.soundcloud.download_sc_track_simple") as mock_download:
-            with patch("handlers.soundcloud.FSInputFile"):
+            with patch("handlers.soundcloud.input_file"), patch("handlers.soundcloud.ensure_uploadable"):
                 mock_path = Mock()
                 mock_path.unlink = Mock()
                 mock_download.return_value = mock_path
@@ -112,18 +197,40 @@ class TestRouterHandlers:
 
     @pytest.mark.asyncio
     async def test_handle_album_callback_valid_hash(self):
-        with patch("handlers.soundcloud.get_url", return_value=self.message.text):
-            with patch("handlers.soundcloud.download_sc_album") as mock_download:
-                with patch("handlers.soundcloud.FSInputFile"):
-                    mock_file = Mock()
-                    mock_file.stat.return_value.st_size = 1000
-                    mock_file.unlink = Mock()
-                    mock_download.return_value = mock_file
+        async def fake_download(url, job, on_volume):
+            volume = Mock()
+            await on_volume(volume)
+            volume.unlink.assert_called_once()
+            return AlbumResult([volume], partial=False)
 
+        with patch("handlers.soundcloud.get_url", return_value=self.message.text):
+            with patch(
+                "handlers.soundcloud.download_sc_album", side_effect=fake_download
+            ) as mock_download:
+                with patch("handlers.soundcloud.input_file"), patch("handlers.soundcloud.ensure_uploadable"):
                     await handle_album_callback(self.callback_query)
 
                     mock_download.assert_called_once()
                     self.callback_query.message.edit_text.assert_called_once()
+                    self.callback_query.message.answer_document.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_handle_album_callback_does_not_cache_failed_volumes(self):
+        async def fake_download(url, job, on_volume):
+            volume = Mock()
+            await on_volume(volume)
+            return AlbumResult([volume, Mock()], partial=True, failed=1)
+
+        with patch("handlers.soundcloud.get_url", return_value=self.message.text), patch(
+            "handlers.soundcloud.download_sc_album", side_effect=fake_download
+        ), patch("handlers.soundcloud.input_file"), patch(
+            "handlers.soundcloud.file_cache.remember"
+        ) as remember:
+            await handle_album_callback(self.callback_query)
+
+        remember.assert_not_called()
+        answered = self.callback_query.message.answer.call_args.args[0]
+        assert "Не удалось отправить 1 из 2" in answered
 
     @pytest.mark.asyncio
     async def test_handle_album_callback_invalid_hash(self):
@@ -137,7 +244,7 @@ class TestRouterHandlers:
     async def test_handle_track_callback(self):
         with patch("handlers.soundcloud.get_url", return_value=self.message.text):
             with patch("handlers.soundcloud.download_sc_track_simple") as mock_download:
-                with patch("handlers.soundcloud.FSInputFile"):
+                with patch("handlers.soundcloud.input_file"), patch("handlers.soundcloud.ensure_uploadable"):
                     mock_path = Mock()
                     mock_path.unlink = Mock()
                     mock_download.return_value = mock_path
@@ -162,3 +269,53 @@ def test_album_detection(url, expected):
         keyword in url.lower() for keyword in ["/sets/", "/playlists/", "/albums/"]
     )
     assert is_album == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("suffix", [".mp3", ".m4a"])
+async def test_telegram_audio_passes_through_supported_formats(tmp_path, suffix):
+    track = tmp_path / f"track{suffix}"
+    track.write_bytes(b"audio")
+
+    with patch("handlers.soundcloud.run_cancellable") as mock_ffmpeg:
+        assert await telegram_audio(track) == track
+
+    mock_ffmpeg.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "suffix,target,codec",
+    [
+        (".opus", ".mp3", "libmp3lame"),
+        (".webm", ".mp3", "libmp3lame"),
+        (".aac", ".m4a", "copy"),
+    ],
+)
+async def test_telegram_audio_converts_only_when_needed(tmp_path, suffix, target, codec):
+    track = tmp_path / f"track{suffix}"
+    track.write_bytes(b"audio")
+
+    with patch("handlers.soundcloud.run_cancellable") as mock_ffmpeg, patch(
+        "handlers.soundcloud.config.FFMPEG_THREADS", 2
+    ):
+        result = await telegram_audio(track)
+
+    command = mock_ffmpeg.call_args.args[0]
+    assert result == track.with_suffix(target)
+    assert command[command.index("-codec:a") + 1] == codec
+    assert command[command.index("-threads") + 1] == "2"
+    assert command.index("-threads") > command.index("-i")
+    assert not track.exists()
+
+
+@pytest.mark.asyncio
+async def test_track_download_prefers_native_mp3_without_postprocessing():
+    with patch("handlers.soundcloud.run_yt_dlp_with_timeout") as mock_run, patch(
+        "handlers.soundcloud.Path.exists", return_value=True
+    ):
+        await download_sc_track_simple("https://soundcloud.com/user/track")
+
+    options = mock_run.call_args.args[1]
+    assert options["format"].startswith("bestaudio[acodec=mp3]")
+    assert "postprocessors" not in options
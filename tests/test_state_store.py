@@ -0,0 +1,146 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from services.state_store import (CallbackStore, MemoryBackend, RedisBackend,
+                                  SQLiteBackend, StateStoreError)
+
+
+class FakeRedisServer:
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    async def handle(self, reader, writer):
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args = []
+            for _ in range(int(header[1:])):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode())
+            self.commands.append(args)
+
+            command = args[0].upper()
+            if command == "SET":
+                self.data[args[1]] = args[2]
+                writer.write(b"+OK\r\n")
+            elif command == "GET":
+                value = self.data.get(args[1])
+                if value is None:
+                    writer.write(b"$-1\r\n")
+                else:
+                    writer.write(b"$%d\r\n%s\r\n" % (len(value.encode()), value.encode()))
+            elif command == "DEL":
+                writer.write(b":%d\r\n" % int(self.data.pop(args[1], None) is not None))
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_ttl_and_lru():
+    backend = MemoryBackend(max_size=2)
+    store = CallbackStore(backend, "yt", ttl=60)
+
+    first = await store.put("https://youtu.be/a")
+    await store.put("https://youtu.be/b")
+    assert await store.get(first) == "https://youtu.be/a"
+    await store.put("https://youtu.be/c")
+
+    assert await store.get(store.make_key("https://youtu.be/b")) is None
+    assert await store.get(first) == "https://youtu.be/a"
+
+    with patch("services.state_store.time.time", return_value=10**12):
+        assert await store.get(first) is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_survives_restart(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    store = CallbackStore(SQLiteBackend(path, max_size=10), "sc", ttl=60)
+    key = await store.put("https://soundcloud.com/a/sets/b")
+    await store.backend.close()
+
+    restarted = CallbackStore(SQLiteBackend(path, max_size=10), "sc", ttl=60)
+    assert await restarted.get(key) == "https://soundcloud.com/a/sets/b"
+    assert await CallbackStore(restarted.backend, "yt", ttl=60).get(key) is None
+    await restarted.backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_evicts_least_recently_used(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.sqlite3"), max_size=1)
+    await backend.set("a", "1", ttl=60)
+    await backend.set("b", "2", ttl=60)
+
+    assert await backend.get("a") is None
+    assert await backend.get("b") == "2"
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_prunes_only_over_capacity_or_on_timer(tmp_path):
+    backend = SQLiteBackend(
+        str(tmp_path / "state.sqlite3"), max_size=10, prune_interval=3600
+    )
+    await backend.set("a", "1", ttl=60)
+    with patch("services.state_store.time.time", return_value=0):
+        await backend.set("old", "2", ttl=1)
+    await backend.set("b", "3", ttl=60)
+
+    conn = backend._connect()
+    assert conn.execute("SELECT COUNT(*) FROM callback_state").fetchone()[0] == 3
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(callback_state)")}
+    assert "callback_state_expires_at" in indexes
+
+    backend._pruned_at = 0
+    await backend.set("c", "4", ttl=60)
+    assert conn.execute("SELECT COUNT(*) FROM callback_state").fetchone()[0] == 3
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_against_local_stand_in():
+    fake = FakeRedisServer()
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisBackend(f"redis://127.0.0.1:{port}/0")
+    store = CallbackStore(backend, "yt", ttl=60)
+
+    try:
+        key = await store.put("https://youtu.be/абв")
+        assert await store.get(key) == "https://youtu.be/абв"
+        await store.delete(key)
+        assert await store.get(key) is None
+        assert fake.commands[0] == ["SET", f"yt:{key}", "https://youtu.be/абв", "EX", "60"]
+
+        with pytest.raises(StateStoreError):
+            await backend._command("PING")
+    finally:
+        await backend.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_drops_connection_after_cancelled_command():
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisBackend(f"redis://127.0.0.1:{port}/0")
+
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(backend.get("yt:key"), 0.1)
+        assert backend._writer is None
+    finally:
+        await backend.close()
+        server.close()
+        await server.wait_closed()
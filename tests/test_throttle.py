@@ -0,0 +1,163 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+from services.cancellation import JobCancelled
+from services.throttle import (AdaptiveThrottle, CircuitBreaker,
+                               CircuitOpenError, PlatformGuard, TokenBucket,
+                               is_platform_failure, is_rate_limited)
+
+
+def test_is_rate_limited():
+    assert is_rate_limited(Exception("HTTP Error 429: Too Many Requests"))
+    assert is_rate_limited(Exception("Please wait a few minutes before you try again"))
+    assert not is_rate_limited(Exception("Unsupported URL"))
+
+
+@pytest.mark.asyncio
+async def test_throttle_slows_down_only_after_rate_limit():
+    throttle = AdaptiveThrottle(base_delay=0.01, max_delay=1)
+    func = AsyncMock(side_effect=[Exception("HTTP Error 429: Too Many Requests"), "ok"])
+
+    assert throttle.delay == 0
+    assert await throttle.call(func, retries=1) == "ok"
+    assert func.call_count == 2
+    assert throttle.delay == 0
+
+
+@pytest.mark.asyncio
+async def test_throttle_does_not_retry_other_errors():
+    throttle = AdaptiveThrottle(base_delay=0.01, max_delay=1)
+    func = AsyncMock(side_effect=ValueError("broken"))
+
+    with pytest.raises(ValueError):
+        await throttle.call(func, retries=3)
+
+    assert func.call_count == 1
+    assert throttle.delay == 0
+
+
+def test_throttle_backoff_is_capped():
+    throttle = AdaptiveThrottle(base_delay=2, max_delay=5)
+
+    throttle.penalize()
+    assert throttle.delay == 2
+    throttle.penalize()
+    throttle.penalize()
+    assert throttle.delay == 5
+    throttle.relax()
+    assert throttle.delay == 2.5
+    throttle.relax()
+    throttle.relax()
+    assert throttle.delay == 0
+
+
+def make_breaker(**overrides):
+    options = {
+        "window": 60,
+        "min_calls": 2,
+        "failure_ratio": 0.5,
+        "cooldown": 30,
+    }
+    options.update(overrides)
+    return CircuitBreaker("Instagram", **options)
+
+
+def test_is_platform_failure():
+    assert is_platform_failure(DownloadError("HTTP Error 403: Forbidden"))
+    assert is_platform_failure(asyncio.TimeoutError())
+    assert not is_platform_failure(DownloadError("Unsupported URL: https://x"))
+    assert not is_platform_failure(ValueError("HTTP Error 500"))
+    assert is_platform_failure(DownloadError("Unable to download webpage: HTTP Error 503"))
+    assert is_platform_failure(DownloadError("Read timed out"))
+    assert not is_platform_failure(
+        DownloadError("Unable to download webpage: HTTP Error 404: Not Found")
+    )
+    assert not is_platform_failure(DownloadError("Video unavailable"))
+
+
+@pytest.mark.asyncio
+async def test_dead_links_do_not_trip_breaker():
+    guard = PlatformGuard(TokenBucket(0, 1), make_breaker(min_calls=5))
+    func = AsyncMock(
+        side_effect=DownloadError("Unable to download webpage: HTTP Error 404: Not Found")
+    )
+
+    for _ in range(5):
+        with pytest.raises(DownloadError):
+            await guard.call(func)
+
+    assert guard.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_guard_trips_and_fails_fast():
+    guard = PlatformGuard(TokenBucket(0, 1), make_breaker())
+    func = AsyncMock(side_effect=DownloadError("HTTP Error 429"))
+
+    for _ in range(2):
+        with pytest.raises(DownloadError):
+            await guard.call(func)
+
+    with pytest.raises(CircuitOpenError, match="Instagram"):
+        await guard.call(func)
+    assert func.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_guard_ignores_non_platform_errors():
+    guard = PlatformGuard(TokenBucket(0, 1), make_breaker())
+    func = AsyncMock(side_effect=JobCancelled())
+
+    for _ in range(3):
+        with pytest.raises(JobCancelled):
+            await guard.call(func)
+
+    assert guard.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_half_open_allows_single_probe():
+    breaker = make_breaker(cooldown=0)
+    breaker.trip(0)
+    guard = PlatformGuard(TokenBucket(0, 1), breaker)
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def probe():
+        started.set()
+        await finish.wait()
+        return "ok"
+
+    task = asyncio.create_task(guard.call(probe))
+    await started.wait()
+    with pytest.raises(CircuitOpenError):
+        await guard.call(AsyncMock())
+
+    finish.set()
+    assert await task == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = make_breaker(cooldown=0)
+    breaker.trip(0)
+
+    breaker.before()
+    breaker.record(False)
+
+    assert breaker.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_out_calls():
+    bucket = TokenBucket(rate=100, burst=1)
+
+    start = time.monotonic()
+    for _ in range(3):
+        await bucket.acquire()
+
+    assert time.monotonic() - start >= 0.015
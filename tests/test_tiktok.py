@@ -1,8 +1,11 @@
+import asyncio
+import time
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 import handlers.tiktok as tiktok
+from services.file_cache import CachedFile
 
 
 @pytest.mark.asyncio
@@ -14,10 +17,10 @@ async def test_download_tiktok():
     mock_message.answer_video = AsyncMock()
 
     with patch("handlers.tiktok.yt_dlp.YoutubeDL") as mock_ytdlp, patch(
-        "handlers.tiktok.FSInputFile"
-    ) as mock_fs_input, patch("handlers.tiktok.os.makedirs"), patch(
-        "handlers.tiktok.os.remove"
-    ):
+        "handlers.tiktok.input_file"
+    ) as mock_fs_input, patch("handlers.tiktok.ensure_uploadable"), patch(
+        "handlers.tiktok.os.makedirs"
+    ), patch("handlers.tiktok.os.remove"):
 
         mock_instance = MagicMock()
         mock_ytdlp.return_value.__enter__.return_value = mock_instance
@@ -28,3 +31,57 @@ async def test_download_tiktok():
 
         mock_message.answer.assert_any_call("Скачиваю видео с TikTok...")
         mock_message.answer_video.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_download_tiktok_cache_hit():
+    mock_message = AsyncMock()
+    mock_message.text = "https://www.tiktok.com/@test/video/123"
+
+    with patch(
+        "handlers.tiktok.file_cache.get",
+        return_value=[CachedFile("video", "FILE_ID")],
+    ), patch("handlers.tiktok.yt_dlp.YoutubeDL") as mock_ytdlp:
+        await tiktok.download_tiktok(mock_message)
+
+    mock_ytdlp.assert_not_called()
+    mock_message.answer_video.assert_called_once_with(
+        "FILE_ID", caption="Скачано в @SaveTTasrobot"
+    )
+
+
+def test_download_tiktok_video_unique_paths(tmp_path):
+    with patch("handlers.tiktok.yt_dlp.YoutubeDL") as mock_ytdlp:
+        mock_ytdlp.return_value.__enter__.return_value = MagicMock()
+
+        first = tiktok.download_tiktok_video("https://vm.tiktok.com/a/", str(tmp_path))
+        second = tiktok.download_tiktok_video("https://vm.tiktok.com/a/", str(tmp_path))
+
+    assert first != second
+    assert first.endswith(".mp4") and first.startswith(str(tmp_path))
+    assert mock_ytdlp.call_args.args[0]["outtmpl"] == second
+
+
+@pytest.mark.asyncio
+async def test_same_link_downloads_once():
+    messages = [AsyncMock() for _ in range(3)]
+    for index, message in enumerate(messages):
+        message.text = "https://www.tiktok.com/@test/video/shared"
+        message.answer_video.return_value.video.file_id = f"file-{index}"
+
+    def slow_download(url, output_path, token=None):
+        time.sleep(0.05)
+        return "downloads/shared.mp4"
+
+    with patch(
+        "handlers.tiktok.download_tiktok_video", side_effect=slow_download
+    ) as download, patch("handlers.tiktok.input_file"), patch(
+        "handlers.tiktok.ensure_uploadable"
+    ):
+        await asyncio.gather(*(tiktok.download_tiktok(m) for m in messages))
+
+    download.assert_called_once()
+    for message in messages[1:]:
+        message.answer_video.assert_called_once_with(
+            "file-0", caption="Скачано в @SaveTTasrobot"
+        )
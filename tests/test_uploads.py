@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+import pytest
+from aiogram.types import FSInputFile
+
+from services.uploads import (FileTooLargeError, ensure_uploadable,
+                              format_filter, input_file)
+
+
+def test_input_file_public_api(tmp_path):
+    path = tmp_path / "video.mp4"
+
+    with patch("services.uploads.config.LOCAL_BOT_API", False):
+        assert isinstance(input_file(path), FSInputFile)
+
+
+def test_input_file_local_api_uses_file_uri(tmp_path):
+    path = tmp_path / "video.mp4"
+
+    with patch("services.uploads.config.LOCAL_BOT_API", True):
+        assert input_file(path) == f"file://{path}"
+
+
+def test_format_filter_uses_upload_limit():
+    with patch("services.uploads.config.UPLOAD_LIMIT", 1000):
+        assert format_filter() == "[filesize<?1000][filesize_approx<?1000]"
+
+
+def test_ensure_uploadable(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"x" * 10)
+
+    with patch("services.uploads.config.UPLOAD_LIMIT", 10):
+        assert ensure_uploadable(path) == path
+
+    with patch("services.uploads.config.UPLOAD_LIMIT", 5):
+        with pytest.raises(FileTooLargeError):
+            ensure_uploadable(path)
+
+    with pytest.raises(FileNotFoundError, match="не найден"):
+        ensure_uploadable(tmp_path / "skipped_by_max_filesize.mp4")
@@ -2,6 +2,7 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+import yt_dlp
 
 import handlers.youtube as youtube
 
@@ -71,7 +72,8 @@ async def test_youtube_keyboard_handler():
     fake_message = AsyncMock()
     fake_message.text = "https://www.youtube.com/watch?v=abc123"
 
-    await youtube.youtube_handler(fake_message)
+    with patch("handlers.youtube.get_info", side_effect=Exception("offline")):
+        await youtube.youtube_handler(fake_message)
 
     fake_message.answer.assert_called_once()
     args, kwargs = fake_message.answer.call_args
@@ -83,13 +85,34 @@ async def test_youtube_keyboard_handler():
     assert any(btn.text == "MP3" for row in kb.inline_keyboard for btn in row)
 
 
+@pytest.mark.asyncio
+async def test_youtube_playlist_link_skips_probe():
+    fake_message = AsyncMock()
+    fake_message.text = "https://www.youtube.com/playlist?list=PL123"
+
+    with patch("handlers.youtube.get_info") as get_info:
+        await youtube.youtube_handler(fake_message)
+
+    get_info.assert_not_called()
+    kb = fake_message.answer.call_args.kwargs["reply_markup"]
+    assert [btn.text for btn in kb.inline_keyboard[-1]] == ["MP3"]
+
+
+@pytest.mark.asyncio
+async def test_probe_does_not_wait_behind_downloads():
+    with patch("handlers.youtube.scheduler.run", AsyncMock(return_value=FAKE_INFO)) as run:
+        await youtube.get_info("https://youtu.be/probepool")
+
+    assert run.call_args.args[0] == "youtube_probe"
+
+
 @pytest.mark.asyncio
 async def test_youtube_callback_triggers_download(tmp_path):
     fake_callback = AsyncMock()
     fake_callback.data = "yt:1234abcd:mp3"
     fake_callback.message = AsyncMock()
 
-    youtube.cache["1234abcd"] = {"url": "https://youtu.be/fake"}
+    await youtube.cache.set("1234abcd", "https://youtu.be/fake")
 
     with patch(
         "handlers.youtube.download_youtube",
@@ -101,3 +124,136 @@ async def test_youtube_callback_triggers_download(tmp_path):
         await youtube.youtube_callback(fake_callback)
 
     fake_callback.message.answer_audio.assert_called_once()
+
+
+def test_download_youtube_limits_format_size(tmp_path):
+    with patch("yt_dlp.YoutubeDL") as mock_ytdlp, patch(
+        "handlers.youtube.config.UPLOAD_LIMIT", 1000
+    ):
+        mock_instance = MagicMock()
+        mock_instance.extract_info.return_value = {"id": "abc123", "ext": "mp4"}
+        mock_instance.prepare_filename.return_value = str(tmp_path / "abc123.mp4")
+        mock_ytdlp.return_value.__enter__.return_value = mock_instance
+
+        youtube.download_youtube("https://youtu.be/abc123", str(tmp_path), "720p")
+
+    options = mock_ytdlp.call_args.args[0]
+    assert options["max_filesize"] == 1000
+    assert "[height<=720]" in options["format"]
+    assert "[filesize<?1000]" in options["format"]
+
+
+FAKE_INFO = {
+    "id": "abc123",
+    "duration": 100,
+    "formats": [
+        {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a", "filesize": 2 * 1024 * 1024},
+        {"format_id": "18", "ext": "mp4", "height": 360, "vcodec": "avc1", "acodec": "mp4a", "filesize": 10 * 1024 * 1024},
+        {"format_id": "136", "ext": "mp4", "height": 720, "vcodec": "avc1", "acodec": "none", "filesize": 30 * 1024 * 1024},
+        {"format_id": "137", "ext": "mp4", "height": 1080, "vcodec": "avc1", "acodec": "none", "tbr": 8000},
+    ],
+}
+
+
+def test_format_options_estimates_sizes():
+    with patch("handlers.youtube.config.YT_HEIGHTS", (360, 480, 720, 1080)):
+        options = dict(youtube.format_options(FAKE_INFO))
+
+    mb = 1024 * 1024
+    assert options == {
+        "360p": 10 * mb,
+        "720p": 32 * mb,
+        "1080p": 100_000_000 + 2 * mb,
+        "mp3": 2 * mb,
+    }
+
+
+def test_keyboard_disables_formats_over_limit():
+    mb = 1024 * 1024
+    options = [("360p", 10 * mb), ("1080p", 100 * mb), ("mp3", 2 * mb)]
+
+    with patch("handlers.youtube.config.UPLOAD_LIMIT", 50 * mb):
+        kb = youtube.build_keyboard("key", options)
+
+    buttons = {btn.text: btn.callback_data for row in kb.inline_keyboard for btn in row}
+    assert buttons["360p · 10 МБ"] == "yt:key:360p"
+    assert buttons["🚫 1080p · 100 МБ"] == "yt:too_big"
+    assert buttons["MP3 · 2 МБ"] == "yt:key:mp3"
+
+
+@pytest.mark.asyncio
+async def test_get_info_probes_once_per_video():
+    with patch("handlers.youtube.probe_youtube", return_value=FAKE_INFO) as probe:
+        first = await youtube.get_info("https://youtu.be/probe1")
+        second = await youtube.get_info("https://www.youtube.com/watch?v=probe1")
+
+    assert first is second is FAKE_INFO
+    probe.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_youtube_callback_reuses_probed_info(tmp_path):
+    fake_callback = AsyncMock()
+    fake_callback.data = "yt:probed:720p"
+    fake_callback.message = AsyncMock()
+
+    await youtube.cache.set("probed", "https://youtu.be/probed")
+    await youtube.probe_cache.set("probed", FAKE_INFO, 60)
+
+    filepath = tmp_path / "file.mp4"
+    filepath.write_bytes(b"testdata")
+
+    with patch(
+        "handlers.youtube.download_youtube", return_value=str(filepath)
+    ) as download, patch("handlers.youtube.input_file"):
+        await youtube.youtube_callback(fake_callback)
+
+    assert download.call_args.args[-1] is FAKE_INFO
+    fake_callback.message.answer_video.assert_called_once()
+
+
+def test_download_youtube_reuses_info(tmp_path):
+    with patch("yt_dlp.YoutubeDL") as mock_ytdlp:
+        mock_instance = MagicMock()
+        mock_instance.process_ie_result.return_value = FAKE_INFO
+        mock_instance.prepare_filename.return_value = str(tmp_path / "abc123.mp4")
+        mock_ytdlp.return_value.__enter__.return_value = mock_instance
+
+        youtube.download_youtube(
+            "https://youtu.be/abc123", str(tmp_path), "1080p", info=FAKE_INFO
+        )
+
+    mock_instance.process_ie_result.assert_called_once_with(FAKE_INFO, download=True)
+    mock_instance.extract_info.assert_not_called()
+    assert "[height<=1080]" in mock_ytdlp.call_args.args[0]["format"]
+
+
+def test_download_youtube_mp3_ignores_probed_requested_formats(tmp_path):
+    def fmt(format_id, **fields):
+        return {"format_id": format_id, "url": f"https://example.com/{format_id}", **fields}
+
+    audio = fmt("140", ext="m4a", vcodec="none", acodec="mp4a", filesize=1000)
+    video = fmt("137", ext="mp4", vcodec="avc1", acodec="none", height=1080, filesize=9000)
+    info = {
+        "id": "abc123",
+        "title": "probed",
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+        "webpage_url": "https://www.youtube.com/watch?v=abc123",
+        "formats": [audio, video],
+        "requested_formats": [video, audio],
+        "format_id": "137+140",
+    }
+
+    process_ie_result = yt_dlp.YoutubeDL.process_ie_result
+    with patch.object(yt_dlp.YoutubeDL, "process_info") as process_info, patch.object(
+        yt_dlp.YoutubeDL, "process_ie_result", autospec=True, side_effect=process_ie_result
+    ) as process:
+        youtube.download_youtube(
+            "https://youtu.be/abc123", str(tmp_path), "mp3", info=info
+        )
+
+    assert "requested_formats" not in process.call_args.args[1]
+    downloaded = process_info.call_args.args[0]
+    assert downloaded["format_id"] == "140"
+    assert "requested_formats" not in downloaded